@@ -6,11 +6,7 @@
 """This package generates the Input of microkinetic models for Maple.  
    
 Possible expansions:  
-    * Put is and fs as lists, to support H2 dissociative adsorption for instance.
-    * Non-isothermal reactors, T dependent on time. 
-    * Non-isobaric   reactors, P dependent on time.   
     * Cycle the model making the energies depend on two or more parameters (PCA). 
-    * Consider coverage effects.    
     * Unidimensional diffusion, taking stationary state conditions in Fick's law. 
 Security checks to implement: 
     * Check if float(conf['Catalyst']['areaactivesite']) gives no error. 
@@ -19,34 +15,55 @@ Security checks to implement:
 
 # Load libraries 
 import amklib       
+import os 
 
 # Initialize variables
 ltp={}                    # List-to-print dictionary of lists
 
 # Read configuration file 
 conf=amklib.readconf("./parameters.txt") 
+amklib.log_event(conf,'start',directory=os.getcwd(),
+                 backend=amklib.get_solver(conf)['backend'],reactortype=amklib.get_reactortype(conf)) 
 
-# Read the input files int&rxn as dictionary of dictionaries. 
-itm=amklib.read('./itm.csv')
-rxn=amklib.read('./rxn.csv')
-#print('\n \n', int, '\n \n' , rxn, '\n \n')
+# Parameter sweep: solve every condition of the [Sweep] section in parallel, and stop. 
+if conf.has_section('Sweep') : 
+    with amklib.timed(conf,'sweep') : 
+        amklib.sweep(conf) 
+    exit() 
 
-# Electrochemical part: Get electric potential; adjust potentials if in electrochem conditions. 
-elecpot=amklib.get_elecpot(conf) # Gets electric potential vs SHE (vs RHE in config file). 
-if elecpot !=0 : 
-    get_nelect_for_rxn(conf,itm,rxn) 
-    amklib.adjust_energy_with_potential(conf,itm,elecpot) 
-    amklib.adjust_energy_with_potential(conf,rxn,elecpot) 
+# Continuation: steady states along a grid of potential, pH or temperature, each one 
+# starting from the previous one, and stop. 
+if conf.has_section('Continuation') : 
+    with amklib.timed(conf,'continuation') : 
+        amklib.continuation(conf) 
+    exit() 
 
-# Prepare site balance equation, solver for SODE, and initial conditions. 
-# Also initialize the list of differential equations.
-itm,sbalance,sodesolv,initialc,rhsparse=amklib.process_intermediates(conf,itm,ltp)
+# Read the input files int&rxn, reduce and process them; or take them from the cache, if 
+# enabled and the inputs are unchanged. 
+network=amklib.load_network(conf,amklib.inputfiles) 
+itm,rxn,ltp,model,sbalance,sodesolv,initialc,rhsparse=network 
+amklib.log_event(conf,'network',**amklib.network_size(model)) 
 
-# Prepare kinetic constants and rates of all chemical steps. 
-# Also expand list of differential equations in "itm" to include chemical steps. 
-itm,rxn=amklib.process_rxn(conf,itm,rxn,ltp)
+# Print Maple input, or integrate the SODE in-process. Steady states are always solved in-process. 
+if amklib.get_reactortype(conf)=='SteadyState' : 
+    model=amklib.compile_network(conf,model) 
+    with amklib.timed(conf,'solve_steady') : 
+        amklib.solve_steady(conf,model,ltp) 
+elif amklib.get_solver(conf)['backend'] in ['Python','Module'] : 
+    model=amklib.compile_network(conf,model) 
+    with amklib.timed(conf,'solve_sode') : 
+        amklib.solve_sode(conf,model,ltp,amklib.inputfiles) 
+else : 
+    # Quasi-equilibrium collapse of the fastest steps: print a DAE. 
+    if amklib.get_quasiequilibrium(conf)>0 : 
+        itm,initialc,sodesolv=amklib.quasi_equilibrium_maple(conf,amklib.compile_network(conf,model),
+                                                             itm,initialc,sodesolv) 
+    with amklib.timed(conf,'printtxt') : 
+        amklib.printtxt(conf,itm,rxn,sbalance,initialc,sodesolv,rhsparse,ltp,filenames=amklib.inputfiles)
 
-# Print Maple input. 
-amklib.printtxt(conf,itm,rxn,sbalance,initialc,sodesolv,rhsparse,ltp)
+# Degrees of rate control of the output rates at the steady state. 
+if conf.has_section('RateControl') : 
+    with amklib.timed(conf,'rate_control') : 
+        amklib.rate_control(conf,amklib.compile_network(conf,model)) 
 
 
@@ -1,13 +1,31 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
-import os
-import configparser, ast
+import numpy as np
+import os, sys, io, functools, contextlib
+import configparser, ast, re
 import copy  
+import warnings 
      
 #Constants 
 kbh="20836612225.1252"    # Boltzmann constant divided by Planck constant, s^-1, string.  
 kbev="8.617333262145E-5"  # Boltzmann constant in eV·K−1, string. 
 avogadro=6.02214199E23    # Avogadro's constant. 
+hck="1.438776877"         # Second radiation constant h*c/kB in cm·K, string: wavenumbers to temperatures. 
+phases=['cat','gas','aqu']  # Phases of the intermediates, coded by their index in compiled models. 
+navalues={'','#N/A','#N/A N/A','#NA','-1.#IND','-1.#QNAN','-NaN','-nan','1.#IND','1.#QNAN', 
+          '<NA>','N/A','NA','NULL','NaN','n/a','nan','null'} # Missing values in tables, as in pandas.
+sweepsections={'reactortemp':'Reactor', 'electricpotentialrhe':'Electrochemistry', 
+               'ph':'Electrochemistry'}  # Sections of the options that can be swept by name. 
+sweepdata={}              # Parsed network shared with the worker processes of sweep. 
+ratecontroldata={}        # Network and steady state shared with the worker processes of rate_control. 
+vibrationdata={}          # Log of the vibrational partition functions, by (network hash, temperature). 
+programdata={}            # Compiled expressions of the [Program] section, by expression. 
+programfunctions={'exp':np.exp, 'log':np.log, 'sqrt':np.sqrt,   # Functions allowed in [Program], 
+                  'min':lambda *a : functools.reduce(np.minimum,a),   # with the names of Maple. 
+                  'max':lambda *a : functools.reduce(np.maximum,a)} 
+noncachedsections=['Solver','Sweep','Cache','RateControl','Checkpoint','Log','Continuation']  # Sections that do not enter the processed network. 
+noncachedoptions=[('General','mapleoutput'), ('General','mapleinput'), ('General','binaryoutput'), 
+                  ('Reactor','reactortype'), ('Reactor','time1')]  # Idem for single options. 
+inputfiles=['./itm.csv','./rxn.csv']  # Intermediates and reactions, as read by amk.py. 
      
 def readconf(filename='./parameters.txt'):  
     """This function reads the input parameters from a file
@@ -41,22 +59,70 @@ def rxntime(conf) :
         time1=time1raw
     return time1, timel 
     
-def read(filename='./itm.csv') :  
+def read(filename='./itm.csv',engine='native') :  
     """This function reads a file containing information of species in 
     gas, aqu(eous), or adsorbed on cat(alyst). 
     It can also read the reactions file. . 
-    It requires pandas to be loaded.  
+    Rows are streamed into the dictionary by a whitespace-table parser; 
+    bracketed lists (frq, lateral) and quoted fields (Notes) are kept as a single value. 
+    Each column is typed as a whole, like pandas: int, float, or str; missing values are NaN. 
       
     Args: 
         filename: Input file. The columns are separated by one or more spaces.
             Energies must be provided in eV and frequencies in cm-1 Format:
+            Lateral interactions (optional): [intermediate:eV,...], see parse_lateral.
+        engine: 'native' (default), or 'pandas' to use pandas.read_csv, imported only then. 
       
     Returns: 
         dicint: a dictionary containing at least the tags, energies, and frequencies of all species.     
       
     """
+    if engine=='pandas' : 
+        import pandas as pd 
+        return pd.read_csv(filename, delim_whitespace=True, index_col='label').T.to_dict()
      
-    dic=pd.read_csv(filename, delim_whitespace=True, index_col='label').T.to_dict()
+    token=re.compile(r'"[^"]*"|\[[^\]]*\]|\S+') 
+    dic={} 
+    with open(filename) as f : 
+        header=None 
+        for number,line in enumerate(f,1) : 
+            row=[item[1:-1] if item[0]=='"' else item for item in token.findall(line)] 
+            if not row : 
+                continue 
+            if header is None : 
+                header=row 
+                if 'label' not in header : 
+                    print("No label column in",filename) 
+                    exit() 
+                ilabel=header.index('label') 
+                keys=[key for key in header if key!='label'] 
+                continue 
+            if len(row)>len(header) : 
+                print("Too many fields in",filename,"line",number,":\n",line) 
+                exit() 
+            if len(row)<=ilabel : 
+                print("No label in",filename,"line",number,":\n",line) 
+                exit() 
+            label=row.pop(ilabel) 
+            dic[label]=dict(zip(keys,row)) 
+     
+    if header is None : 
+        print("No header in",filename) 
+        exit() 
+     
+    # Type each column with the narrowest type that fits all its values. 
+    for key in keys : 
+        values=[record.get(key) for record in dic.values()] 
+        present=[value for value in values if value is not None and value not in navalues] 
+        for kind in [int,float,str] : 
+            try : 
+                typed=[kind(value) for value in present] 
+                break 
+            except ValueError : 
+                continue 
+        typed=iter(typed) 
+        for record,value in zip(dic.values(),values) : 
+            record[key]=float('nan') if value is None or value in navalues else next(typed) 
     return dic  
      
      
@@ -85,21 +151,253 @@ def get_damptime(conf) :
     return dampt1, dampt2 
      
       
+def get_outputfile(conf) : 
+    """Name of the output file, removing " ' and spaces from it. 
+    """
+    return conf['General']['mapleoutput'].replace('"','').replace("'","").replace(" ","")
+     
+     
+def get_binaryoutput(conf) : 
+    """Name of the columnar binary copy of the results of the in-process backends, from the 
+    binaryoutput option of [General] (see write_columns). Empty (none) by default. 
+    """
+    if not conf.has_option('General','binaryoutput') : 
+        return '' 
+    return conf['General']['binaryoutput'].replace('"','').replace("'","").strip() 
+     
+     
+def get_constantsmode(conf) : 
+    """How kinetic constants are written in the Maple input, from [General] constants: 
+    Symbolic (default, T can be edited inside Maple), Numeric (evaluated here), 
+    or Shared (numeric, and reactions with identical constants use a single one). 
+    """
+    mode='Symbolic' 
+    if conf.has_option('General','constants') : 
+        mode=conf['General']['constants'].replace('"','').replace("'","").strip()
+    if mode not in ['Symbolic','Numeric','Shared'] : 
+        print("Unknown constants mode",mode,"\n I only recognize Symbolic, Numeric, and Shared") 
+        exit() 
+    return mode 
+     
+     
+def get_solver(conf) :  
+    """Parse the [Solver] section of the configuration file. 
+     
+    Args: 
+        conf: Configuration data. 
+     
+    Returns: 
+        solver: Dict with the backend ('Maple', 'Python', or 'Module', see rhs_module), 
+            the integration method of scipy.integrate.solve_ivp ('BDF', 'Radau', 'LSODA'), 
+            the tolerances, the Jacobian ('Analytical' or 'Numerical'), the file where the 
+            Jacobian at the last time is exported (none if empty), the file of the 
+            generated Python module, and maxfev, the evaluations of the right-hand side per 
+            time of time1 before falling back to Radau (see integrate_sode). 
+    """
+    solver={'backend':'Maple', 'method':'BDF', 'rtol':1E-8, 'atol':1E-12, 
+            'jacobian':'Analytical', 'jacobianoutput':'', 'module':'amkrhs.py', 'maxfev':50000} 
+    if conf.has_section('Solver') : 
+        for key in solver : 
+            if conf.has_option('Solver',key) : 
+                solver[key]=conf['Solver'][key].replace('"','').replace("'","") 
+    solver['rtol']=float(solver['rtol'])
+    solver['atol']=float(solver['atol'])
+    solver['maxfev']=int(float(solver['maxfev']))
+    return solver 
+     
+      
+def get_reactortype(conf) :  
+    """Reactor type from the configuration file, without quotes: 
+    Differential (default), SteadyState, or Programmed (see get_program). 
+    """
+    try :  
+        reactortype=conf['Reactor']['reactortype'].replace('"','').replace("'","") 
+    except :  
+        reactortype='Differential' 
+    return reactortype 
+     
+      
+def get_program(conf) : 
+    """Parse the [Program] section of the programmed reactor (reactortype=Programmed): 
+    the temperature (reactortemp) and the pressures or concentrations of the feeds (by label) 
+    as functions of the time t in s, in K, atm or mol/L. Each one is either an expression of t, 
+    with numbers, + - * / ^, exp, log, sqrt, min and max, e.g. reactortemp=300+2*t, or a table 
+    of (t, value) pairs, linear in between and constant outside, e.g. gR=[(0,0.0),(10,1.0)]. 
+    Empty for other reactor types. 
+     
+    Returns: 
+        program: Dict of the options, lowercase, to the expression (str, with ** for powers) 
+            or the table (tuple of pairs sorted by time). See program_value and maple_program. 
+    """
+    if get_reactortype(conf)!='Programmed' : 
+        return {} 
+    if not conf.has_section('Program') : 
+        print("reactortype=Programmed requires a [Program] section.") 
+        exit() 
+    program={} 
+    for key in conf['Program'] : 
+        value=conf['Program'][key].replace('"','').replace("'","").strip() 
+        if value.startswith('[') : 
+            try : 
+                table=tuple(sorted((float(ti),float(vi)) for ti,vi in ast.literal_eval(value))) 
+            except (ValueError,SyntaxError,TypeError) : 
+                table=() 
+            if not table : 
+                print("Wrong table in [Program]:",key,"=",value,"\n Use [(t0,value0),(t1,value1),...]") 
+                exit() 
+            program[key]=table 
+            continue 
+        value=value.replace('^','**') 
+        try : 
+            tree=ast.parse(value,mode='eval') 
+        except SyntaxError : 
+            tree=None 
+        allowed=(ast.Expression,ast.BinOp,ast.UnaryOp,ast.Call,ast.Name,ast.Load,ast.Constant, 
+                 ast.Add,ast.Sub,ast.Mult,ast.Div,ast.Pow,ast.USub,ast.UAdd) 
+        if tree is None or not all([isinstance(node,allowed) for node in ast.walk(tree)]) or \
+           any([isinstance(node,ast.Name) and node.id not in ['t']+list(programfunctions) or 
+                isinstance(node,ast.Constant) and not isinstance(node.value,(int,float)) or 
+                isinstance(node,ast.Call) and not isinstance(node.func,ast.Name) 
+                for node in ast.walk(tree)]) : 
+            print("Wrong expression in [Program]:",key,"=",value, 
+                  "\n Use numbers, t, + - * / ^, and",", ".join(programfunctions)) 
+            exit() 
+        program[key]=value 
+    return program 
+     
+     
+def program_value(program,t) : 
+    """Value of an expression or table of get_program at the time t (or array of times). 
+    Expressions are compiled once, and kept in programdata. 
+    """
+    if isinstance(program,tuple) : 
+        times,values=zip(*program) 
+        return np.interp(t,times,values) 
+    if program not in programdata : 
+        programdata[program]=compile(program,'[Program]','eval') 
+    return eval(programdata[program],{'__builtins__':{}},dict(programfunctions,t=t))*np.ones_like(t,dtype=float) 
+     
+     
+def maple_program(program) : 
+    """Maple expression of t of an expression or table of get_program: tables as piecewise. 
+    """
+    if not isinstance(program,tuple) : 
+        return program.replace('**','^') 
+    terms=[] 
+    for (t0,v0),(t1,v1) in zip(program[:-1],program[1:]) : 
+        if t1>t0 : 
+            terms.append("t<"+repr(t1)+", "+repr(v0)+"+("+repr(v1-v0)+")*(t-"+repr(t0)+")/"+repr(t1-t0)) 
+    return "piecewise(t<"+repr(program[0][0])+", "+repr(program[0][1])+", "+ \
+           "".join(term+", " for term in terms)+repr(program[-1][1])+")" 
+     
+     
+def get_vibrations(conf) : 
+    """Options of the harmonic vibrational partition functions, from the [Vibrations] section: 
+    zpe (False: the energies already include the zero-point energy) and cutoff, in cm-1, 
+    the lowest frequency, to which softer modes are raised (0 by default). 
+    Empty (disabled) without the section. 
+    """
+    if not conf.has_section('Vibrations') : 
+        return {} 
+    vibrations={'zpe':False, 'cutoff':0.0} 
+    if conf.has_option('Vibrations','zpe') : 
+        vibrations['zpe']=ast.literal_eval(conf['Vibrations']['zpe'].strip()) 
+    if conf.has_option('Vibrations','cutoff') : 
+        vibrations['cutoff']=float(conf['Vibrations']['cutoff']) 
+    return vibrations 
+     
+     
+def get_checkpoint(conf) : 
+    """File where the time course is checkpointed after each time of time1, from the 
+    [Checkpoint] section: option file, the output file plus ".ckpt" by default. 
+    Empty (disabled) without the section. 
+    """
+    if not conf.has_section('Checkpoint') : 
+        return '' 
+    if conf.has_option('Checkpoint','file') : 
+        return conf['Checkpoint']['file'].replace('"','').replace("'","").strip() 
+    return get_outputfile(conf)+'.ckpt' 
+     
+     
+def get_log(conf) : 
+    """File of the JSON-lines log of timings and solver statistics, from the [Log] section: 
+    option file, the output file plus ".jsonl" by default. Empty (disabled) without the section. 
+    """
+    if not conf.has_section('Log') : 
+        return '' 
+    if conf.has_option('Log','file') : 
+        return conf['Log']['file'].replace('"','').replace("'","").strip() 
+    return get_outputfile(conf)+'.jsonl' 
+     
+     
+def log_event(conf,event,**fields) : 
+    """Appends one JSON line to the log (see get_log): time stamp, event name, and fields. 
+    Does nothing if the log is disabled. 
+    """
+    import json, time 
+    filename=get_log(conf) 
+    if not filename : 
+        return 
+    record={'time':time.time(), 'event':event, 'pid':os.getpid()} 
+    record.update(fields) 
+    with open(filename,'a') as f : 
+        f.write(json.dumps(record,default=float)+"\n") 
+     
+     
+@contextlib.contextmanager 
+def timed(conf,phase,**fields) : 
+    """Context manager that logs the wall and CPU time of a phase of the run (see log_event). 
+    """
+    import time 
+    wall,cpu=time.perf_counter(),time.process_time() 
+    yield 
+    log_event(conf,'phase',phase=phase,wall=time.perf_counter()-wall,cpu=time.process_time()-cpu,
+              **fields) 
+     
+     
+def network_size(model) : 
+    """Size of a compiled model (see compile_model), for the log: intermediates by phase, 
+    reactions, differential equations, and entries of the stoichiometric matrix. 
+    """
+    size={'intermediates':len(model['itm']), 'reactions':len(model['rxn']), 
+          'equations':int(model['dyn'].shape[0]), 
+          'stoichiometry':int((model['state']>=0).sum())} 
+    for i,phase in enumerate(phases) : 
+        size[phase]=int((model['phase']==i).sum()) 
+    return size 
+     
+     
 def get_elecpot(conf) : 
     """This function extracts the electric potential vs RHE from the configuration file. 
     returns the electric potential vs SHE. 
     """
     try :  
-        elecpot=(float(conf['Electrochemistry']['electricpotentialrhe'])-
-                 float(conf['Electrochemistry']['pH'])*float(kbeV)*  
-                 float(conf['Reactor']['reactortemp'])*ln(10.0) ) 
+        elecpot=rhe_to_she(float(conf['Electrochemistry']['electricpotentialrhe']),
+                           float(conf['Electrochemistry']['pH']),
+                           float(conf['Reactor']['reactortemp'])) 
     except :  
         elecpot=0.0 
     return elecpot 
+     
+     
+def rhe_to_she(elecpotrhe,pH,T) : 
+    """Converts electric potentials vs RHE to vs SHE. Works on numpy arrays. 
+    """
+    return elecpotrhe-pH*float(kbev)*T*np.log(10.0) 
+     
+     
+def get_nelectronslabel(conf) : 
+    """Label of the column with the number of electrons, "ne" by default. 
+    """
+    try :   
+        label=conf['Electrochemistry']['nelectronslabel']  
+    except :   
+        label="ne"  
+    return label 
         
     
 def get_nelect_for_itm(itm,item,label) : 
-    if item==None : 
+    if item==None or item=='None' : 
         nelect=0.0  
     else : 
         try : 
@@ -110,30 +408,45 @@ def get_nelect_for_itm(itm,item,label) :
     return nelect
        
        
+def get_states(record) : 
+    """Initial and final states of a reaction: the bracketed lists of the is and fs columns, 
+    e.g. [gH2,iO,iO] for a dissociative adsorption, or else is1, is2 and fs1, fs2. 
+    Species are repeated as many times as their stoichiometric coefficient; None is skipped. 
+     
+    Returns: 
+        initial, final: Lists of labels. 
+    """
+    states=[] 
+    for column,columns in [('is',['is1','is2']),('fs',['fs1','fs2'])] : 
+        value=record.get(column).strip() if isinstance(record.get(column),str) else '' 
+        # Only a bracketed list; e.g. None in the column falls back to the numbered ones. 
+        if value.startswith('[') and value.lstrip('[').rstrip(']').strip() : 
+            labels=[label.strip().strip('"').strip("'") for label in value.lstrip('[').rstrip(']').split(',')] 
+        else : 
+            labels=[record.get(state) for state in columns] 
+        states.append([label for label in labels if isinstance(label,str) and label not in ['None','']]) 
+    return states[0], states[1] 
+     
+     
 def get_nelect_for_rxn(conf,itm,rxn) :  
     """Get the number of electrons for a particular transition state
     from alpha values
     """ 
-    try :   
-        label=conf['Electrochemistry']['nelectronslabel']  
-    except :   
-        label="ne"  
+    label=get_nelectronslabel(conf) 
     for item in sorted(rxn) : 
-        rxn[item][label]=((1-float(rxn[item][alpha]))*(
-                          get_nelect_for_itm(itm,rxn[item]['is1'],label)+
-                          get_nelect_for_itm(itm,rxn[item]['is2'],label))+
-                          float(rxn[item][alpha])*(
-                          get_nelect_for_itm(itm,rxn[item]['fs1'],label)+
-                          get_nelect_for_itm(itm,rxn[item]['fs2'],label)))  
+        try : 
+            alpha=float(rxn[item]['alpha']) 
+        except : 
+            continue # Without alpha, keep the number of electrons given in the file. 
+        initial,final=get_states(rxn[item]) 
+        rxn[item][label]=((1-alpha)*sum([get_nelect_for_itm(itm,state,label) for state in initial])+
+                          alpha*sum([get_nelect_for_itm(itm,state,label) for state in final]))  
           
       
 def adjust_energy_with_potential(conf,itm,elecpot) : 
     """Adds the electric potential component to the Gibbs energy. 
     """ 
-    try :  
-        label=conf['Electrochemistry']['nelectronslabel']  
-    except :  
-        label="ne"  
+    label=get_nelectronslabel(conf) 
     for item in sorted(itm) :  
         try :  
             itm[item]['G']=float(itm[item]['G'])+float(itm[item][label])*elecpot
@@ -147,6 +460,196 @@ def adjust_energy_with_potential(conf,itm,elecpot) :
             exit()  
         
       
+def get_reduction(conf) : 
+    """Parse the [Reduction] section of the configuration file: include/exclude rules on the 
+    labels (shell-style patterns, e.g. 'i4*'), phases, and carbon numbers of the intermediates. 
+    The carbon number is the first digit of the label, e.g. 2 for i211101 (C2H1O1). 
+    Each option is a list or a single value. 
+     
+    Also, prune=True removes the intermediates and reactions unreachable from the feeds 
+    (see prune_network), and prunereport names the file that lists them. 
+     
+    Returns: 
+        rules: Dict of lists with keys includelabels, excludelabels, includephases, 
+            excludephases, includecarbons, and excludecarbons. Empty if not given. 
+            And prune (bool) and prunereport (file name, none if empty). 
+    """
+    rules={key:[] for key in ['includelabels','excludelabels','includephases', 
+                              'excludephases','includecarbons','excludecarbons']} 
+    rules['prune']=False 
+    rules['prunereport']='' 
+    for key in conf['Reduction'] : 
+        if key=='quasiequilibrium' : 
+            continue # Applied after processing, see get_quasiequilibrium. 
+        if key not in rules : 
+            print("Unknown option in [Reduction]:",key,"\n I only recognize",list(rules)+['quasiequilibrium']) 
+            exit() 
+        if key=='prune' : 
+            rules[key]=conf.getboolean('Reduction',key) 
+            continue 
+        if key=='prunereport' : 
+            rules[key]=conf['Reduction'][key].replace('"','').replace("'","").strip() 
+            continue 
+        try : 
+            values=ast.literal_eval(conf['Reduction'][key]) 
+        except (ValueError,SyntaxError) : 
+            values=conf['Reduction'][key].strip() # Unquoted single value, e.g. excludephases=aqu 
+        if not isinstance(values,(list,tuple)) : 
+            values=[values] 
+        rules[key]=[str(value) for value in values] 
+    return rules 
+     
+     
+def get_carbons(item) : 
+    """Carbon number encoded in the label of an intermediate, or None if there is not. 
+    """
+    if len(item)>1 and item[1].isdigit() : 
+        return item[1] 
+    return None 
+     
+     
+def reduce_network(conf,itm,rxn,messages=None) : 
+    """Removes the intermediates excluded by the rules of the [Reduction] section (see 
+    get_reduction), together with every reaction that involves them. An intermediate is kept 
+    if it matches the include rules given (all, if none) and none of the exclude rules. Rules 
+    on carbon numbers skip labels without it. The site-balance species is always kept. 
+    The size of the reduced system is reported on the standard error. 
+     
+    Args: 
+        conf: Configuration data. 
+        itm: Dict of dicts of intermediates, as read. 
+        rxn: Dict of dicts of reactions, as read. 
+        messages: List where the lines reported are also appended, e.g. to cache them. (Mutable)
+     
+    Returns: 
+        itm, rxn: Reduced dicts of dicts. 
+    """
+    import fnmatch 
+    rules=get_reduction(conf) 
+    sbs=conf['Catalyst']['sitebalancespecies'] 
+     
+    def match(item,kind) : 
+        """True if item matches any of the rules of this kind, e.g. 'exclude'.""" 
+        carbons=get_carbons(item) 
+        return (any([fnmatch.fnmatchcase(item,pattern) for pattern in rules[kind+'labels']]) or 
+                str(itm[item]['phase']) in rules[kind+'phases'] or 
+                (carbons is not None and carbons in rules[kind+'carbons'])) 
+     
+    include=rules['includelabels'] or rules['includephases'] or rules['includecarbons'] 
+    removed={item for item in itm if item!=sbs and 
+             ((include and not match(item,'include')) or match(item,'exclude'))} 
+    nitm,nrxn=len(itm),len(rxn) 
+    itm={item:record for item,record in itm.items() if item not in removed} 
+    rxn={item:record for item,record in rxn.items() 
+         if not any([state in removed for side in get_states(record) for state in side])} 
+    if rules['prune'] : 
+        itm,rxn=prune_network(conf,itm,rxn,rules['prunereport'],messages) 
+    line=("Reduction: "+str(len(itm))+" of "+str(nitm)+" intermediates ("+ 
+          str(sum([itm[item]['phase']=='cat' and item!=sbs for item in itm]))+ 
+          " differential equations), "+str(len(rxn))+" of "+str(nrxn)+" reactions.\n") 
+    sys.stderr.write(line) 
+    if messages is not None : 
+        messages.append(line) 
+    return itm, rxn 
+     
+     
+def get_feeds(conf,itm) : 
+    """Intermediates with nonzero pressure or concentration in the configuration file, 
+    or in any value of the [Sweep] grids of those sections, or programmed in [Program] 
+    (tables with a nonzero value, and every expression). 
+    """
+    feeds=set() 
+    for section in ['Pressures','Concentrations'] : 
+        if conf.has_section(section) : 
+            feeds|={item for item in itm if conf.has_option(section,item) and 
+                    float(conf[section][item])!=0} 
+    if conf.has_section('Sweep') : 
+        for key,section,option,values in get_sweep(conf)[0] : 
+            if section in ['Pressures','Concentrations'] and any([float(value)!=0 for value in values]) : 
+                feeds|={item for item in itm if item.lower()==option.lower()} 
+    program=get_program(conf) 
+    feeds|={item for item in itm if item.lower() in program and 
+            (not isinstance(program[item.lower()],tuple) or any([v!=0 for t,v in program[item.lower()]]))} 
+    return feeds 
+     
+     
+def prune_network(conf,itm,rxn,report='',messages=None) : 
+    """Removes the intermediates that can never be populated, and the reactions that can never 
+    run, starting from a clean surface. Sources are the feeds (see get_feeds) and the site-balance 
+    species; a reaction runs, in either direction, once all the intermediates of one side are 
+    reached, and then reaches those of the other side. Pruned species stay at zero and pruned 
+    reactions at zero rate, so the solution of the remaining network is unchanged. 
+     
+    Args: 
+        conf: Configuration data. 
+        itm: Dict of dicts of intermediates, as read. 
+        rxn: Dict of dicts of reactions, as read. 
+        report: File where the labels of the pruned intermediates and reactions are listed. 
+        messages: List where the line reported is also appended, see reduce_network. (Mutable)
+     
+    Returns: 
+        itm, rxn: Pruned dicts of dicts. 
+    """
+    import collections 
+    sides={item:get_states(record) for item,record in rxn.items()} 
+    # Missing counters: intermediates of each side of each reaction not reached yet. 
+    missing={} 
+    where=collections.defaultdict(list) 
+    for item in rxn : 
+        for s,states in enumerate(sides[item]) : 
+            missing[item,s]=len(states) 
+            for species in states : 
+                where[species].append((item,s)) 
+     
+    # Breadth-first search on the bipartite graph of intermediates and reactions. 
+    reached=get_feeds(conf,itm)|{conf['Catalyst']['sitebalancespecies']} 
+    running=set() 
+    queue=collections.deque([('itm',item) for item in reached]) 
+    queue.extend([('rxn',item) for item,s in missing if missing[item,s]==0]) # Nothing on one side. 
+    while queue : 
+        kind,node=queue.popleft() 
+        if kind=='itm' : 
+            for item,s in where[node] : 
+                missing[item,s]-=1 
+                if missing[item,s]==0 : 
+                    queue.append(('rxn',item)) 
+            continue 
+        if node in running : 
+            continue 
+        running.add(node) 
+        # Once a side is complete, the reaction populates the other one. 
+        for s in range(2) : 
+            if missing[node,s]>0 : 
+                continue 
+            for species in sides[node][1-s] : 
+                if species not in reached : 
+                    reached.add(species) 
+                    queue.append(('itm',species)) 
+     
+    prunedrxn=sorted([item for item in rxn if item not in running]) 
+    prunedintm=sorted([item for item in itm if item not in reached]) 
+    line=("Pruning: "+str(len(prunedintm))+" unreachable intermediates and "+ 
+          str(len(prunedrxn))+" reactions that cannot run.\n") 
+    sys.stderr.write(line) 
+    if messages is not None : 
+        messages.append(line) 
+    if report : 
+        with open(report,'w') as f : 
+            f.write("# Intermediates\n"+"".join([item+"\n" for item in prunedintm])) 
+            f.write("# Reactions\n"+"".join([item+"\n" for item in prunedrxn])) 
+    itm={item:record for item,record in itm.items() if item in reached} 
+    rxn={item:record for item,record in rxn.items() if item in running} 
+    return itm, rxn 
+     
+     
+def concentration_factor(conf) : 
+    """Factor from concentrations in mol/L to molecules per active site in the second layer, 
+    as in process_intermediates. 
+    """
+    return (float(conf['Catalyst']['areaactivesite'])*float(conf['Catalyst']['secondlayerthickness'])* 
+            avogadro*1E-27) 
+     
+     
 def process_intermediates(conf,itm,ltp) :
     """This function process the "intermediates" dataframe to generate 
     the site-balance equation, the SODE-solver, and the initial conditions as clean surface. 
@@ -228,6 +731,17 @@ def process_intermediates(conf,itm,ltp) :
                   "\n I only recognize 'aqu', 'cat', and 'gas'") 
             exit()
                                             
+    # Programmed pressures and concentrations (see get_program), in atm or mol/L. 
+    program=get_program(conf) 
+    for item in itm : 
+        if item.lower() in program and itm[item]['phase'] in ['gas','aqu'] : 
+            itm[item]['program']=program[item.lower()] 
+    unknown=set(program)-{'reactortemp'}-{item.lower() for item in itm if 'program' in itm[item]} 
+    if unknown : 
+        print("Unknown options in [Program]:",sorted(unknown),
+              "\n I only recognize reactortemp and the labels of gas and aqueous species") 
+        exit() 
+     
     # Close the site-balance equation     
     sbalance=sbalance+" : " 
      
@@ -240,143 +754,297 @@ def process_intermediates(conf,itm,ltp) :
     return itm, sbalance, sodesolv, initialc, rhsparse  
      
      
-def is_gas(itm,rxn,item,state) :  
-    """ Returns 1 if a given (initial/final) state of rxn #item is gas.
-    Returns 0 otherwise.  """
-    #print(item,state,rxn[item][state],itm['gP']['phase']) 
-    if   rxn[item][state]=='None' or rxn[item][state]==None : 
-        gas=0 
-    else : 
-        if itm[rxn[item][state]]['phase']=='gas' : 
-            gas=1  
-        elif itm[rxn[item][state]]['phase']=='cat' or itm[rxn[item][state]]['phase']=='aqu' : 
-            gas=0  
-        else : 
-            print("Phase of rxn#",item," intermediate ",rxn[item][state],":", 
-                  itm[rxn[item][state]]['phase'],"Not recognized" ) 
-    return gas   
-        
-        
-def mw_gas(itm,rxn,item,state) :  
-    """ Returns the mass weight of a gas-phase intermediate. Zero if adsorbed """
-    if   rxn[item][state]=='None' or rxn[item][state]==None :
-        mw=0
-    else :
-        if itm[rxn[item][state]]['phase']=='gas' :
-            mw=float(itm[rxn[item][state]]['mw'])
-        elif itm[rxn[item][state]]['phase']=='cat' :
-            mw=0              
-        elif itm[rxn[item][state]]['phase']=='aqu' :
-            mw=0 
-        else :
-            print("Phase of rxn#",item," intermediate ",rxn[item][state],":",
-                  itm[rxn[item][state]]['phase'],"Not recognized" )
-    return mw 
-     
-     
-def kinetic_constants(conf,itm,rxn,item) : 
-    """ Prepares the kinetic constants for direct and (i)reverse semireactions 
-    depending on the number of gas-phase intermediates. 
-    Returns error if there are more than two species in gas for a given semirxn. """
-    rxn[item]['kd']="" 
-    rxn[item]['ki']="" 
-    howmanygasd=is_gas(itm,rxn,item,'is1')+is_gas(itm,rxn,item,'is2')
-    howmanygasi=is_gas(itm,rxn,item,'fs1')+is_gas(itm,rxn,item,'fs2')
-    area="{:.6f}".format( float(conf['Catalyst']['areaactivesite']) ) # Site area in Å²
-    # Direct semireaction:      
-    if   howmanygasd==0 :
-        # If semireaction on surface: use Arrhenius kb*T/h*exp(-Ga/kB*T)
-        rxn[item]['kd']="k"+item+"d:=evalf("+kbh+"*T*exp(-max(0.0,"+\
-                        "{:.6f}".format( rxn[item]['aGd'])+","+\
-                        "{:.6f}".format( rxn[item]['dGd'])+\
-                        ")/("+kbev+"*T)) ) : "
-    elif howmanygasd==1 :
-        mw="{:.6f}".format(mw_gas(itm,rxn,item,'is1')+mw_gas(itm,rxn,item,'is2'))
-                                           # (atm=>Pa)*Area*(Å²=>m²)
-        rxn[item]['kd']="k"+item+"d:=evalf((101325*"+area+"*1E-20"+\
-                        "*exp(-max(0.0,"+\
-                        "{:.6f}".format( rxn[item]['aGd'])+","+\
-                        "{:.6f}".format( rxn[item]['dGd'])+\
-                        ")/("+kbev+"*T)))"+\
-                        "/sqrt(2*Pi*1.6605390400E-27*"+mw+"*1.3806485200E-23*T )) : "
-                        # Denominator: sqrt(2Pi(elemmass@kg)*massweight*kB(SI)*T
-    else :
-        print("WARNING! direct reaction #",item,"has",howmanygasd,"gas/aq reactants.")
+def parse_lateral(value,label='') : 
+    """Parses the lateral column of intermediates and transition states: a bracketed list of 
+    intermediate:energy pairs, the change of the energy in eV per unit coverage of each 
+    intermediate, e.g. [iCO:0.20,iH:0.05]. Missing values and [] have no interactions. 
+     
+    Returns: 
+        pairs: List of (intermediate, energy). 
+    """
+    if not isinstance(value,str) : 
+        return [] # Missing (NaN) 
+    pairs=[] 
+    for item in value.strip().lstrip('[').rstrip(']').split(',') : 
+        if not item.strip() : 
+            continue 
+        try : 
+            other,eps=item.split(':') 
+            pairs.append((other.strip().strip('"').strip("'"),float(eps))) 
+        except ValueError : 
+            print("Wrong lateral interactions of",label,":",value, 
+                  "\n Expected a list of intermediate:energy, e.g. [iCO:0.20,iH:0.05]") 
+            exit() 
+    return pairs 
+     
+     
+def lateral_reactions(model) : 
+    """Lateral interactions of the reactions, from those of the intermediates and transition 
+    states in model['lateral'] (see compile_model): change of dGd, aGd and aGi per unit coverage of each intermediate. 
+     
+    Returns: 
+        dGd, aGd, aGi: Sparse (nrxn, nitm) matrices. 
+    """
+    from scipy import sparse 
+    nitm=len(model['itm']) 
+    nrxn=len(model['rxn']) 
+    def incidence(states) : 
+        j,k=np.nonzero(states>=0) 
+        return sparse.csr_matrix((np.ones(j.shape[0]),(j,states[j,k])),shape=(nrxn,nitm+nrxn)) 
+    w=model['state'].shape[1]//2 
+    IS=incidence(model['state'][:,:w]) 
+    FS=incidence(model['state'][:,w:]) 
+    TS=incidence(nitm+np.arange(nrxn)[:,None]) 
+    return [(m.dot(model['lateral'])).tocsr() for m in [FS-IS,TS-IS,TS-FS]] 
+     
+     
+def compile_model(conf,itm,rxn) : 
+    """Compiles the intermediates and reactions into a model of numpy arrays, 
+    the common representation of the network for the Maple renderer and the numerical backends. 
+    Requires process_intermediates to be run first (pressures and concentrations). 
+      
+    Args: 
+        conf: Configuration data. 
+        itm: Dict of dicts of intermediates. 
+        rxn: Dict of dicts of reactions. 
+      
+    Returns: 
+        model: Dict containing: 
+            itm, rxn: Sorted labels of intermediates and reactions. 
+            phase: Phase code of each intermediate, index in the list "phases". 
+            G, mw, feed, ne: Energy, mass weight (gas only), pressure or concentration (gas/aqu), 
+                and number of electrons of each intermediate. 
+            sbs, dyn: Index of the site-balance species (-1 if not listed) and indices of the species with 
+                differential equations, in the order of the SODE solver. 
+            state: Indices of the initial and final states of each reaction, w slots each 
+                (w=2 for is1, is2, fs1, fs2; more with the lists of get_states); -1 if empty. 
+            damped: True for gas/aqu states, which carry a damping term. 
+            GTS, dGd, aGd, aGi: Energy of the transition state, reaction and activation energies. 
+            neTS, ned, nei: Number of electrons of the transition state, initial and final states. 
+            elecpot: Electric potential vs SHE already included in the energies (get_elecpot). 
+            gasd, gasi, mwd, mwi: Number and mass weight of gas-phase species in each semireaction. 
+            lateral: Only if the inputs have lateral interactions: sparse (nitm+nrxn, nitm) matrix 
+                of the change of the energy of each intermediate and transition state (nitm+j) 
+                per unit coverage of each intermediate, see parse_lateral; and latrxn, 
+                the same for the reactions, see lateral_reactions. 
+            program: With reactortype=Programmed only: the expression or table of the temperature 
+                (None if constant) and (index, expression or table, unit factor) of each programmed feed. 
+            nu, modeof, zpe, vibkey: With [Vibrations] only: frequencies in cm-1, index of the species 
+                of each one (nitm+j for the transition state of reaction j), the zpe option, and 
+                the hash of the three under which vibrational_lnq caches its results. 
+    """
+    sbs=conf['Catalyst']['sitebalancespecies']
+    model={} 
+    model['itm']=sorted(itm) 
+    model['rxn']=sorted(rxn) 
+    index={item:i for i,item in enumerate(model['itm'])}
+    nitm=len(model['itm'])
+    nrxn=len(model['rxn'])
+     
+    # Intermediates 
+    model['phase']=np.zeros(nitm,dtype=int)
+    model['G']=np.zeros(nitm)
+    model['mw']=np.zeros(nitm)
+    model['feed']=np.zeros(nitm)
+    model['ne']=np.zeros(nitm)
+    label=get_nelectronslabel(conf) 
+    for i,item in enumerate(model['itm']) : 
+        if itm[item]['phase'] not in phases : 
+            print("Unknown phase for ",item,itm[item]['phase'],
+                  "\n I only recognize 'aqu', 'cat', and 'gas'") 
+            exit()
+        model['phase'][i]=phases.index(itm[item]['phase'])
+        model['G'][i]=itm[item]['G'] 
+        try : 
+            model['ne'][i]=float(itm[item][label]) 
+        except : 
+            pass # Non-electrochemical networks carry no electron count. 
+        if   itm[item]['phase']=='gas' : 
+            model['mw'][i]=itm[item]['mw'] 
+            model['feed'][i]=itm[item]['pressure'] 
+        elif itm[item]['phase']=='aqu' : 
+            model['feed'][i]=itm[item]['concentration'] 
+    model['sbs']=index.get(sbs,-1) # Not necessarily listed among the intermediates. 
+    if get_reactortype(conf)=='Programmed' : 
+        # Temperature and feeds as functions of time (see get_program), feeds in the units of 'feed'. 
+        model['program']={'T':get_program(conf).get('reactortemp'), 
+                          'feed':[(i,itm[item]['program'],1.0 if itm[item]['phase']=='gas' else 
+                                   concentration_factor(conf)) 
+                                  for i,item in enumerate(model['itm']) if 'program' in itm[item]]} 
+    model['dyn']=np.array([i for i,item in enumerate(model['itm']) 
+                           if model['phase'][i]==0 and item!=sbs],dtype=int) 
+     
+    # Reactions: indices of initial and final states, w slots per side (two at least). 
+    states={item:get_states(rxn[item]) for item in model['rxn']} 
+    w=max([2]+[len(side) for item in states for side in states[item]]) 
+    model['state']=np.full((nrxn,2*w),-1,dtype=int)
+    model['GTS']=np.zeros(nrxn) 
+    model['neTS']=np.full(nrxn,np.nan) 
+    for j,item in enumerate(model['rxn']) : 
+        model['GTS'][j]=rxn[item]['G'] 
+        try : 
+            model['neTS'][j]=rxn[item][label] 
+        except : 
+            pass 
+        if not states[item][0] or not states[item][1] : 
+            print("\n Error!, reaction ",item," has no ","initial" if not states[item][0] else "final", 
+                  " state, check is1, is2, fs1, fs2 or the is and fs lists.") 
+            exit() 
+        for s,side in enumerate(states[item]) : 
+            for k,state in enumerate(side) : 
+                try: 
+                    model['state'][j,s*w+k]=index[state] 
+                except: 
+                    print("\n Error!, reaction ",item, " comes from ",state,
+                          " whose energy was not found.")
+                    exit()
+    exists=model['state']>=0 
+    phase=np.where(exists,model['phase'][model['state']],-1) 
+    model['damped']=exists&(phase!=0) 
+     
+    # Reaction (dG) and activation (aG) energies, both direct and inverse. 
+    G=np.where(exists,model['G'][model['state']],0.0) 
+    model['dGd']=G[:,w:].sum(axis=1) 
+    model['aGd']=model['GTS'].copy() 
+    model['aGi']=model['GTS'].copy() 
+    for k in range(w) : # Subtracted state by state, G[:,2]+G[:,3]-G[:,0]-G[:,1] for w=2. 
+        model['dGd']-=G[:,k] 
+        model['aGd']-=G[:,k] 
+        model['aGi']-=G[:,w+k] 
+     
+    # Electrons: transition states without them take the ones of the initial state. 
+    ne=np.where(exists,model['ne'][model['state']],0.0) 
+    model['ned']=ne[:,:w].sum(axis=1) 
+    model['nei']=ne[:,w:].sum(axis=1) 
+    model['neTS']=np.where(np.isnan(model['neTS']),model['ned'],model['neTS']) 
+    model['elecpot']=get_elecpot(conf) 
+     
+    # Gas-phase species, for Hertz-Knudsen constants. 
+    gas=phase==1 
+    mw=np.where(gas,model['mw'][model['state']],0.0)
+    model['gasd']=gas[:,:w].sum(axis=1) 
+    model['gasi']=gas[:,w:].sum(axis=1) 
+    model['mwd']=mw[:,:w].sum(axis=1) 
+    model['mwi']=mw[:,w:].sum(axis=1) 
+    for j in np.nonzero(model['gasd']>1)[0] : 
+        print("WARNING! direct reaction #",model['rxn'][j],"has",model['gasd'][j],"gas/aq reactants.")
         print("Abnormal termination")
         exit()
-    # Reverse (i) semireaction:      
-    if   howmanygasi==0 : 
-        rxn[item]['ki']="k"+item+"i:=evalf("+kbh+"*T*exp(-max(0.0,"+\
-                        "{:.6f}".format( rxn[item]['aGi'])+","+\
-                        "{:.6f}".format(-rxn[item]['dGd'])+\
-                        ")/("+kbev+"*T)) ) : "
-    elif howmanygasi==1 : 
-        mw="{:.6f}".format(mw_gas(itm,rxn,item,'fs1')+mw_gas(itm,rxn,item,'fs2')) 
-        rxn[item]['ki']="k"+item+"i:=evalf((101325*"+area+"*1E-20"+\
-                        "*exp(-max(0.0,"+\
-                        "{:.6f}".format( rxn[item]['aGi'])+","+\
-                        "{:.6f}".format(-rxn[item]['dGd'])+\
-                        ")/("+kbev+"*T)))"+\
-                        "/sqrt(2*Pi*1.6605390400E-27*"+mw+"*1.3806485200E-23*T )) : "
-    else :
-        print("WARNING! reverse reaction #",item,"has",howmanygasd,"gas/aq reactants.")
+    for j in np.nonzero(model['gasi']>1)[0] : 
+        print("WARNING! reverse reaction #",model['rxn'][j],"has",model['gasi'][j],"gas/aq reactants.")
         print("Abnormal termination")
         exit()
+     
+    # Intermediates and transition states (index nitm+j), for their vibrations and lateral interactions. 
+    species=[(item,itm) for item in model['itm']]+[(item,rxn) for item in model['rxn']] 
+     
+    # Lateral interactions: energies linear in the coverages of adsorbed intermediates. 
+    rows,cols,vals=[],[],[] 
+    for s,(label,dic) in enumerate(species) : 
+        for other,eps in parse_lateral(dic[label].get('lateral',float('nan')),label) : 
+            if other not in index : 
+                sys.stderr.write("Lateral interaction of "+label+" with "+other+ 
+                                 ", not in the network, ignored.\n") 
+                continue 
+            if model['phase'][index[other]]!=0 : 
+                print("Lateral interaction of",label,"with",other,", not an adsorbed intermediate.") 
+                exit() 
+            rows.append(s) 
+            cols.append(index[other]) 
+            vals.append(eps) 
+    if rows : 
+        from scipy import sparse 
+        model['lateral']=sparse.csr_matrix((vals,(rows,cols)),shape=(nitm+nrxn,nitm)) 
+        model['latrxn']=lateral_reactions(model) 
+     
+    # Vibrational modes, only if requested. 
+    vibrations=get_vibrations(conf) 
+    if vibrations : 
+        nu=[] 
+        modeof=[] 
+        for s,(label,dic) in enumerate(species) : 
+            frq=dic[label].get('frq',float('nan')) 
+            try : 
+                frq=np.atleast_1d(np.array(ast.literal_eval(frq) if isinstance(frq,str) else frq,dtype=float)) 
+            except (ValueError,SyntaxError) : 
+                print("Wrong frequencies of",label,":",frq) 
+                exit() 
+            frq=frq[frq>0] # Missing values, and the imaginary mode of transition states, as non-positive. 
+            nu.append(np.maximum(frq,vibrations['cutoff'])) 
+            modeof.append(np.full(frq.shape[0],s)) 
+        model['nu']=np.concatenate(nu) 
+        model['modeof']=np.concatenate(modeof).astype(int) 
+        model['zpe']=bool(vibrations['zpe']) 
+        import hashlib 
+        model['vibkey']=hashlib.sha256(repr((model['zpe'],nitm)).encode()+model['nu'].tobytes()+ 
+                                       model['modeof'].tobytes()).hexdigest() 
+    return model 
+     
+     
+def kinetic_constants(conf,model,j) : 
+    """ Prepares the kinetic constants for direct and (i)reverse semireactions of reaction #j 
+    depending on the number of gas-phase intermediates: Arrhenius on surface, 
+    Hertz-Knudsen if one of the species is in gas phase. 
+    With [Vibrations], Arrhenius prefactors include q(TS)/q(IS) as products over the modes. 
+    With lateral interactions, the energies depend on the coverages c(t), and the constants 
+    of the reaction are functions of t: k(t). In programmed reactors all constants are k(t), 
+    with the temperature T(t). 
+     
+    Returns: 
+        kd, ki: Maple expressions of the direct and reverse constants. 
+    """
+    item=model['rxn'][j] 
+    area="{:.6f}".format( float(conf['Catalyst']['areaactivesite']) ) # Site area in Å²
+    T="T(t)" if 'program' in model else "T" 
+    qratio=["",""] 
+    if 'vibkey' in model : 
+        # Harmonic partition functions as products over the modes, see vibrational_lnq. 
+        mode="exp(-"+hck+"*v/(2*"+T+"))" if model['zpe'] else "1" 
+        def partition(s) : 
+            nu=model['nu'][model['modeof']==s] 
+            if s<0 or nu.shape[0]==0 : 
+                return [] 
+            return ["mul("+mode+"/(1-exp(-"+hck+"*v/"+T+")),v in ["+ 
+                    ",".join("{:.6f}".format(v) for v in nu)+"])"] 
+        qTS=partition(len(model['itm'])+j) 
+        w=model['state'].shape[1]//2 
+        for s,states in enumerate([model['state'][j,:w],model['state'][j,w:]]) : 
+            qIS=sum([partition(state) for state in states],[]) 
+            qratio[s]="".join("*"+qi for qi in qTS)+("/("+"*".join(qIS)+")" if qIS else "") 
+    # Lateral interactions: energies linear in the coverages, and constants functions of t. 
+    lateral={'aGd':"",'aGi':"",'dGd':"",'dGi':""} 
+    arrow="(t)->" if 'program' in model else "" 
+    if 'lateral' in model : 
+        def coverages(m,sign=1.0) : 
+            row=m.getrow(j) 
+            return "".join("{:+.6f}".format(sign*eps)+"*c"+model['itm'][i]+"(t)" 
+                           for i,eps in sorted(zip(row.indices,row.data)) if eps!=0) 
+        dGd,aGd,aGi=model['latrxn'] 
+        lateral={'aGd':coverages(aGd),'aGi':coverages(aGi),'dGd':coverages(dGd),'dGi':coverages(dGd,-1.0)} 
+        if any(lateral.values()) : 
+            arrow="(t)->" 
+    k=[]
+    for semirxn,gas,mw,aG,dG,q in [('d',model['gasd'][j],model['mwd'][j],model['aGd'][j], model['dGd'][j],qratio[0]), 
+                                   ('i',model['gasi'][j],model['mwi'][j],model['aGi'][j],-model['dGd'][j],qratio[1])] : 
+        energies="{:.6f}".format(aG)+lateral['aG'+semirxn]+","+"{:.6f}".format(dG)+lateral['dG'+semirxn] 
+        if gas==0 : 
+            # If semireaction on surface: use Arrhenius kb*T/h*exp(-Ga/kB*T)
+            k.append("k"+item+semirxn+":="+arrow+"evalf("+kbh+"*"+T+q+"*exp(-max(0.0,"+\
+                     energies+\
+                     ")/("+kbev+"*"+T+")) ) : ")
+        else : 
+                                           # (atm=>Pa)*Area*(Å²=>m²)
+            k.append("k"+item+semirxn+":="+arrow+"evalf((101325*"+area+"*1E-20"+\
+                     "*exp(-max(0.0,"+energies+\
+                     ")/("+kbev+"*"+T+")))"+\
+                     "/sqrt(2*Pi*1.6605390400E-27*"+"{:.6f}".format(mw)+"*1.3806485200E-23*"+T+" )) : ")
+                     # Denominator: sqrt(2Pi(elemmass@kg)*massweight*kB(SI)*T
+    return k[0], k[1] 
         
-      
-def process_itm_on_rxn(conf,itm,rxn,item,state,dampt1,dampt2) :  
-    """ Use the is/fs states for each reaction to get their activation energies. 
-    Then write the formula for reaction rate according to their intermediates. 
-        This formula is split between rtd (direct part) and rti (inverse part). 
-    Then update the differential equations in which each adsorbed species participates. 
-    If a rectant is in gas phase, include a Hertz-Knudsen term in the constant 
-        and its pressure as variable in the reaction rate.
-    """
-     
-    if   state=='is1' or state=='is2' : 
-        semirxn='d'
-        sign='-' # Consume reactants 
-    elif state=='fs1' or state=='fs2' : 
-        semirxn='i'
-        sign='+' # Increase products 
-    else : 
-        print("Wrong state for reaction", item, "\nOnly 'is1', 'is2', 'fs1', and 'fs2' supported") 
-        exit() 
-         
-    # Get energy of the (initial/final) state "i" 
-    if rxn[item][state]=='None' or rxn[item][state]==None :
-        G=0.0
-    else:
-        try:
-            G=itm[rxn[item][state]]['G'] 
-        except: 
-            print("\n Error!, reaction ",item, " comes from ",state, rxn[item][state],
-                  " whose energy was not found.")
-            exit()
-        # If (initial/final) state "i" is on catalyst, include concentration in rxn equation
-        # and add rxn to respective differential equation. 
-        if  itm[rxn[item][state]]['phase']=='cat':
-            rxn[item]['rt'+semirxn]+="*c"+rxn[item][state]+"(t)"
-            rxn[item]['srt'+semirxn]+="*sc"+rxn[item][state]
-            # Do not generate differential equation for site-balance species (empty site?). 
-            if rxn[item][state]!=conf['Catalyst']['sitebalancespecies'] :
-                itm[rxn[item][state]]['diff']+=sign+"r"+item+"(t)"
-        # If (initial/final) state "i" is "gas" (or aqueous) use P instead of c(t) 
-        # and do not generate any differential equation.  
-        elif itm[rxn[item][state]]['phase']=='gas':
-            rxn[item]['rt'+semirxn]+= dampt1+"*P"+rxn[item][state]
-            rxn[item]['srt'+semirxn]+=dampt2+"*P"+rxn[item][state] 
-        # If (initial/final) state "i" is "aqu" (or aqueous) use CSL instead of c(t) 
-        # and do not generate any differential equation.  
-        elif itm[rxn[item][state]]['phase']=='aqu': 
-            rxn[item]['rt'+semirxn]+= dampt1+"*CSL"+rxn[item][state]    
-            rxn[item]['srt'+semirxn]+=dampt2+"*CSL"+rxn[item][state]   
-    return G  
-       
         
-def process_rxn(conf,itm,rxn,ltp) : 
-    """Subroutine that expands the "rxn" dictionary of dictionaries to include 
-    the kinetic constants and rates of all chemical reactions. 
+def process_rxn(conf,itm,rxn,ltp,model=None) : 
+    """Subroutine that renders the compiled model as Maple input: it expands the "rxn" 
+    dictionary of dictionaries to include the kinetic constants and rates of all chemical reactions. 
     It also expands the list of differential equations in "itm"
     and the list of reactions in which each intermediate participates. 
     
@@ -384,61 +1052,104 @@ def process_rxn(conf,itm,rxn,ltp) :
         conf: Configuration data.
         rxn: Dict of dicts containing the reactions. (Mutable)
         itm: Dict of dicts containing at least a list of intermediates as index. (Mutable)
+        model: Compiled model, see compile_model. Compiled here if not provided. 
     
     Returns: 
         rxn: Expanded dict of dicts containing adsorption/desorption constants and rates. (Mutable)
         itm: Expanded dict of dicts with list of differential equations updated with chemical reactions. (Mutable)
     """ 
+    if model is None : 
+        model=compile_model(conf,itm,rxn) 
           
     # Get pressure damp     
     dampt1,dampt2=get_damptime(conf)     
          
     # Initialize list-to-print: reactions, for postprocessing. 
     ltp['rxn']=[]  
-        
-    for item in sorted(rxn) : 
-        # Initialize variables 
-        rxn[item]['dGd']=""
-        rxn[item]['aGd']=""
-        rxn[item]['aGi']=""
-        rxn[item]['rtd']="r"+item+":=(t)-> k"+item+"d"
-        rxn[item]['rti']="-k"+item+"i"
-        rxn[item]['srtd']="sr"+item+":= k"+item+"d" 
-        rxn[item]['srti']="-k"+item+"i"
-        #howmanygasd=0
-        #howmanygasi=0        
-           
-        # Use the is/fs states for each reaction to get their activation energies. 
-        # Then write the formula for reaction rate according to their intermediates. 
-        #     This formula is split between rtd (direct part) and rti (inverse part). 
-        # Then update the differential equations in which each adsorbed species participates. 
-        # If a rectant is in gas phase, include a Hertz-Knudsen term in the constant 
-        #     and its pressure as variable in the reaction rate.
-        # For gaseous and aqueous species, include a damping term for numerical stability.       
-        Gi1=process_itm_on_rxn(conf,itm,rxn,item,'is1',dampt1,dampt2)  
-        Gi2=process_itm_on_rxn(conf,itm,rxn,item,'is2',dampt1,dampt2)  
-        Gf1=process_itm_on_rxn(conf,itm,rxn,item,'fs1',dampt1,dampt2)  
-        Gf2=process_itm_on_rxn(conf,itm,rxn,item,'fs2',dampt1,dampt2)  
+     
+    # Factor of each intermediate in the reaction rates, in processing (rt) and post-processing (srt). 
+    # Adsorbed species use c(t); gas use P and aqueous CSL, with a damping term for numerical stability. 
+    # Programmed feeds are functions of t, see printtxt. 
+    programmed=[i for i,program,factor in model.get('program',{}).get('feed',[])] 
+    rt=[] 
+    srt=[] 
+    for i,item in enumerate(model['itm']) : 
+        if   model['phase'][i]==0 : 
+            rt.append("*c"+item+"(t)")
+            srt.append("*sc"+item) 
+        else : 
+            feed=("*P" if model['phase'][i]==1 else "*CSL")+item 
+            rt.append( dampt1+feed+("(t)" if i in programmed else ""))
+            srt.append(dampt2+feed+("(timei)" if i in programmed else ""))
+     
+    # Terms of the differential equation of each adsorbed species, except the site-balance one.  
+    diff={i:[] for i in model['dyn']}  
+     
+    # Name of the constant used by each semireaction; in Shared mode, the first one with the same value. 
+    mode=get_constantsmode(conf) 
+    names=[["k"+item+"d" for item in model['rxn']],["k"+item+"i" for item in model['rxn']]] 
+    # Reactions with lateral interactions, or all in programmed reactors: constants k(t) 
+    # of kinetic_constants in every mode. 
+    lateral=set() 
+    if 'lateral' in model : 
+        size=sum(abs(m) for m in model['latrxn']).sum(axis=1) 
+        lateral=set(np.nonzero(np.asarray(size).ravel())[0].tolist()) 
+    if 'program' in model : 
+        lateral=set(range(len(model['rxn']))) 
+    if mode!='Symbolic' and 'program' not in model : 
+        # Same numerics as the symbolic mode: energies and masses rounded as printed there. 
+        rounded=dict(model,**{key:np.array(["{:.6f}".format(v) for v in model[key]],dtype=float) 
+                              for key in ['dGd','aGd','aGi','mwd','mwi']}) 
+        kval=rate_constants(conf,rounded,float(conf['Reactor']['reactortemp'])) 
+    if mode=='Shared' and 'program' not in model : 
+        first={} 
+        for s in range(2) : 
+            for j,value in enumerate(kval[s]) : 
+                if j not in lateral : 
+                    names[s][j]=first.setdefault(value,names[s][j]) 
+       
+    for j,item in enumerate(model['rxn']) : 
+        state=model['state'][j] 
+        w=state.shape[0]//2 
+        kd,ki=names[0][j],names[1][j] 
+        skd,ski=kd,ki 
+        if j in lateral : 
+            # Constants as functions of t; after the solver, evaluated on the solution S. 
+            kd,ki,skd,ski=kd+"(t)",ki+"(t)","eval("+kd+"(t),S)","eval("+ki+"(t),S)" 
+        # Formula for reaction rate, split between rtd (direct part) and rti (inverse part). 
+        rxn[item]['rtd']="".join(["r",item,":=(t)-> ",kd]+[rt[i] for i in state[:w] if i>=0])
+        rxn[item]['rti']="".join(["-",ki]+[rt[i] for i in state[w:] if i>=0]+[" : "])
+        rxn[item]['srtd']="".join(["sr",item,":= ",skd]+[srt[i] for i in state[:w] if i>=0]) 
+        rxn[item]['srti']="".join(["-",ski]+[srt[i] for i in state[w:] if i>=0])
          
-        # Get reaction (dG) and (aG) activation energies for each reaction, both direct and inverse.  
-        #print("\n",Gdi1,Gdi2,Gdf1,Gdf2)    
-        rxn[item]['dGd']=Gf1+Gf2       -Gi1-Gi2 
-        rxn[item]['aGd']=rxn[item]['G']-Gi1-Gi2 
-        rxn[item]['aGi']=rxn[item]['G']-Gf1-Gf2 
-             
-        # Close the reaction formula with ":"
-        rxn[item]['rti']=rxn[item]['rti']+" : "
+        # Reactants are consumed, products increase. 
+        for k,i in enumerate(state) : 
+            if i in diff : 
+                diff[i].append(("-" if k<w else "+")+"r"+item+"(t)") 
           
-        # Get kinetic constants 
-        kinetic_constants(conf,itm,rxn,item)        
+        # Reaction (dG) and activation (aG) energies, and kinetic constants 
+        rxn[item]['dGd']=model['dGd'][j] 
+        rxn[item]['aGd']=model['aGd'][j] 
+        rxn[item]['aGi']=model['aGi'][j] 
+        if mode=='Symbolic' or j in lateral : 
+            rxn[item]['kd'],rxn[item]['ki']=kinetic_constants(conf,model,j)        
+        else : 
+            # Shared constants are defined once, by the semireaction that gives them name. 
+            rxn[item]['kd'],rxn[item]['ki']=[name+":="+"{:.16E}".format(kval[s][j])+" : " 
+                                             if name=="k"+item+"di"[s] else "" 
+                                             for s,name in enumerate([kd,ki])]
            
         # List of reactions for fprintf function in Maple 
         ltp['rxn'].append('sr'+item)
+     
+    # Update the differential equations 
+    for i in model['dyn'] : 
+        itm[model['itm'][i]]['diff']+="".join(diff[i]) 
            
     return itm, rxn 
         
           
-def printtxt(conf,itm,rxn,sbalance,initialc,sodesolv,rhsparse,ltp) :  
+def printtxt(conf,itm,rxn,sbalance,initialc,sodesolv,rhsparse,ltp,out=None,filenames=inputfiles) :  
     # Before called printtxtsr
     """Subroutine that prints a given calculation for Maple, just a 's'ingle 'r'un 
       
@@ -451,87 +1162,2199 @@ def printtxt(conf,itm,rxn,sbalance,initialc,sodesolv,rhsparse,ltp) :
         initialc: Initial conditions, string. 
         sodesolv: Calls SODE solver in Maple, string.  
         rhsparse: Parser of surface concentrations, string. 
+        out: File name or stream where the input is written. Default: the 
+            mapleinput option of [General] if given, otherwise the standard output. 
+        filenames: Input files of the network, for the key of the checkpoint. 
+     
+    With a [Checkpoint] section (see get_checkpoint) and a list of times, the state is saved 
+    after each time, and the input resumes from the last one saved if run again, appending 
+    to the output file. 
+    With a [Log] section (see get_log), the input appends to the log the CPU and wall times, 
+    from time() and time[real](), of the setup, the call to dsolve, and each time of time1. 
     """
+    # Everything goes to a buffer and is written at once at the end. 
+    buf=io.StringIO() 
+    write=functools.partial(print,file=buf) 
     
-    print("# Heading " )
-    print("restart : \n " )  
+    write("# Heading " )
+    write("restart : \n " )  
+     
+    # Log: JSON lines with the CPU and wall times since the previous line. 
+    logfile=get_log(conf) 
+    def writelog(event,fields='',values='') : 
+        write('fprintf(logfile1,"{\\"event\\": \\"'+event+'\\", \\"backend\\": \\"Maple\\", '+fields+
+              '\\"cpu\\": %.3f, \\"wall\\": %.3f}\\n",'+values+'time()-cpu1, time[real]()-wall1) : '+
+              'FileTools[Flush](logfile1) : cpu1:=time() : wall1:=time[real]() : ') 
+    if logfile : 
+        write('logfile1:=fopen("'+logfile+'",APPEND,TEXT) : cpu0:=time() : wall0:=time[real]() : '+
+              'cpu1:=cpu0 : wall1:=wall0 : ') 
+     
+    # Checkpoint of the time loop: resume from the last completed time of a previous run. 
+    time1,timel=rxntime(conf)
+    checkpoint=get_checkpoint(conf) if timel else '' 
+    if checkpoint : 
+        key=checkpoint_key(conf,filenames) 
+        write("# Checkpoint: ") 
+        write('tstart:=0.0 : ckptkey:="" : ') 
+        write('if FileTools[Exists]("'+checkpoint+'") then read "'+checkpoint+'" : fi : ') 
+        write('if ckptkey<>"'+key+'" then tstart:=0.0 : fi : ') 
+        write('if tstart=0.0 then ') 
         
     # Open file and print labels
-    print('filename1:=FileTools[Text][Open]("',
-          conf['General']['mapleoutput'].replace('"','').replace("'","").replace(" ",""),
-          '",create,overwrite) : ',sep='') # Remove " ' and spaces from name of files. 
-    print('fprintf(filename1,"%q %q\\n",','catalyst, "timei", "T",', 
+    write('filename1:=FileTools[Text][Open]("',get_outputfile(conf),
+          '",create,overwrite) : ',sep='') 
+    write('fprintf(filename1,"%q %q\\n",','catalyst, "timei", "T",', 
           ', '.join(['"'+item+'"' for item in ltp['prs']]) ,",", 
           ', '.join(['"'+item[2:]+'"' for item in ltp['itm']]) ,",",
           ', '.join(['"'+item[2:]+'"' for item in ltp['rxn']]) ,   
           " ): " )   
-    print('FileTools[Flush](filename1) : \n ')  
+    if checkpoint : 
+        # Rows of the completed times are already in the file. 
+        write('else filename1:=fopen("'+get_outputfile(conf)+'",APPEND,TEXT) : fi : ') 
+    write('FileTools[Flush](filename1) : \n ')  
       
-    # Temperature, pressures, and concentration.  
-    print("T:=", conf.get("Reactor","reactortemp"), " : " )
+    # Temperature, pressures, and concentration; functions of t if programmed (see get_program). 
+    program=get_program(conf) 
+    if get_reactortype(conf)=='Programmed' : 
+        write("T:=(t)-> "+maple_program(program.get('reactortemp',conf.get("Reactor","reactortemp")))+" : ") 
+    else : 
+        write("T:=", conf.get("Reactor","reactortemp"), " : " )
     for item in sorted(itm) : 
-        if itm[item]['phase']=='gas' :  
-            print('P'+item+":=",itm[item]['pressure']," : ") 
+        if itm[item]['phase']=='gas' and 'program' in itm[item] : 
+            write('P'+item+":=(t)-> "+maple_program(itm[item]['program'])+" : ") 
+        elif itm[item]['phase']=='gas' :  
+            write('P'+item+":=",itm[item]['pressure']," : ") 
     for item in sorted(itm) : 
-        if itm[item]['phase']=='aqu' :   
-            print('CSL'+item+":=",itm[item]['concentration']," : ") 
+        if itm[item]['phase']=='aqu' and 'program' in itm[item] : 
+            write('CSL'+item+":=(t)-> ("+maple_program(itm[item]['program'])+")*"+ 
+                  repr(concentration_factor(conf))+" : ") 
+        elif itm[item]['phase']=='aqu' :   
+            write('CSL'+item+":=",itm[item]['concentration']," : ") 
+    # Printed at each time: the functions of t at timei. 
+    T=', timei, T,' 
+    prs=ltp['prs'] 
+    if get_reactortype(conf)=='Programmed' : 
+        T=', timei, T(timei),' 
+        programmed={name+item for item in itm if 'program' in itm[item] for name in ['P','CSL']} 
+        prs=[item+"(timei)" if item in programmed else item for item in ltp['prs']] 
       
-    print("\n# Kinetic constants")
+    write("\n# Kinetic constants")
     for item in sorted(rxn) :
-        print(rxn[item]['kd']+"\n"+rxn[item]['ki']  )
+        for k in [rxn[item]['kd'],rxn[item]['ki']] : 
+            if k : # Empty if shared with another reaction. 
+                write(k) 
       
-    print("\n# Reaction rates:")
+    write("\n# Reaction rates:")
     for item in sorted(rxn) :
-        print(rxn[item]['rtd'],rxn[item]['rti'])
+        write(rxn[item]['rtd'],rxn[item]['rti'])
       
-    print("\n# Site-balance equation: ")
-    print(sbalance)
+    write("\n# Site-balance equation: ")
+    write(sbalance)
      
-    print("\n# Differential equations: ")
+    write("\n# Differential equations: ")
     for item in sorted(itm) :
         if  itm[item]['phase']=='cat' and item!=conf['Catalyst']['sitebalancespecies'] : 
-            print(itm[item]['diff']," : ")
+            write(itm[item]['diff']," : ")
+      
+    write("\n# Initial conditions: ")
+    write(initialc)
+    if checkpoint : 
+        write("if tstart>0.0 then IC0:=ICckpt : fi : ") 
       
-    print("\n# Initial conditions: ")
-    print(initialc)
+    if logfile : 
+        writelog('setup') 
       
-    print("\n# SODE Solver: ")
-    print(sodesolv)
+    write("\n# SODE Solver: ")
+    write(sodesolv)
+    if logfile : 
+        writelog('dsolve') 
               
     # Time control: 
-    time1,timel=rxntime(conf)
-    if timel : 
-        print("\n\nfor timei in " + str(time1) + " do ")
+    if checkpoint : 
+        write("\n\nfor timei in select(x->x>tstart, " + str(time1) + ") do ")
+    elif timel : 
+        write("\n\nfor timei in " + str(time1) + " do ")
     else : 
-        print("timei:= "+time1+" : ")
+        write("timei:= "+time1+" : ")
       
-    print("S:=Solution(timei) : ")
+    write("S:=Solution(timei) : ")
     
-    print("\n# Solution parser: ")
-    print(rhsparse)
+    write("\n# Solution parser: ")
+    write(rhsparse)
     
-    print("\n# Site-balance equation after solver: ")
-    tmp=os.popen(    "echo \""+sbalance+"\" | sed 's/(t)//g' "   ).read() # popen and read() are used to save in variable 
-    tmp="s"+os.popen("echo \""+tmp[:-1]+"\" | sed 's/->//g' "    ).read() # rm last character (newline) 
-    print(  os.popen("echo \""+tmp[:-1]+"\" | sed 's/-c/-sc/g' " ).read()[:-1] )
+    write("\n# Site-balance equation after solver: ")
+    write(ltp['itm'][0]+":= 1.0"+"".join([" -"+item for item in ltp['itm'][1:]])+" : ") 
     
-    print("\n# Reaction rates after solver: ")
+    write("\n# Reaction rates after solver: ")
     for item in sorted(rxn) :
-        print(rxn[item]['srtd'],rxn[item]['srti']," : ")
+        write(rxn[item]['srtd'],rxn[item]['srti']," : ")
                    
     # Print results 
-    print("\nfprintf(filename1",',"%q %q\\n",',conf['Catalyst']['name'],', timei, T,',
-          ', '.join([item for item in ltp['prs']]) ,",",
+    write("\nfprintf(filename1",',"%q %q\\n",',conf['Catalyst']['name'],T,
+          ', '.join([item for item in prs]) ,",",
           ', '.join([item for item in ltp['itm']]) ,",", 
           ', '.join([item for item in ltp['rxn']]) , 
           " ): " )  
        
-    print('\nFileTools[Flush](filename1) : ' )   
+    write('\nFileTools[Flush](filename1) : ' )   
+    if logfile : 
+        writelog('segment','\\"t1\\": %.6e, ','timei, ') 
+    if checkpoint : 
+        write('tstart:=timei : ckptkey:="'+key+'" : ICckpt:=op(subs(t=timei,S[2..-1])) : ') 
+        write('save tstart, ckptkey, ICckpt, "'+checkpoint+'" : ') 
      
     if timel :     
-        print("\nod: \n ") 
+        write("\nod: \n ") 
     
     # Print close file instruction  
-    print('\nclose(filename1) : \n \n ')
+    write('\nclose(filename1) : \n \n ')
+    if logfile : 
+        write('cpu1:=cpu0 : wall1:=wall0 : ') 
+        writelog('total') 
+        write('close(logfile1) : \n ') 
+     
+    if out is None and conf.has_option('General','mapleinput') : 
+        out=conf['General']['mapleinput'].replace('"','').replace("'","").strip() 
+    if out is None : 
+        sys.stdout.write(buf.getvalue()) 
+    elif isinstance(out,str) : 
+        with open(out,'w') as f : 
+            f.write(buf.getvalue()) 
+    else : 
+        out.write(buf.getvalue()) 
      
     
+     
+     
+def compile_network(conf,model) : 
+    """Expands the compiled model with the arrays needed to integrate it in-process 
+    instead of printing the Maple input. 
+     
+    The state vector is extended with the site-balance species and a constant 1.0, 
+    x=[c(0),...,c(n-1),csbs,1.0], so that empty, gas and aqueous states point to the 
+    last element and every rate is a product of w elements of x (w slots per side). 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Compiled model, see compile_model. (Mutable)
+     
+    Returns: 
+        model: Expanded with the index arrays, sparse stoichiometry matrix, 
+            and kinetic constants of the network; with lateral interactions, also the 
+            stacked matrix latmat of their effect on dGd, aGd and aGi, see lateral_energies; 
+            in programmed reactors, the arrays of programmed_constants. (Mutable)
+    """
+    from scipy import sparse 
+      
+    n=model['dyn'].shape[0] 
+    nrxn=len(model['rxn'])
+    w=model['state'].shape[1]//2 
+    # Position of each intermediate in x; None states (-1) point to the last element. 
+    xidx=np.full(len(model['itm'])+1,n+1,dtype=int)
+    xidx[model['dyn']]=np.arange(n) 
+    if model['sbs']>=0 : 
+        xidx[model['sbs']]=n 
+    xidx_itm=xidx[:-1] 
+    xidx=xidx[model['state']]
+      
+    # Pressures and concentrations in the same order as ltp['prs'] 
+    model['prs']=model['feed'][model['phase']!=0]
+      
+    # Index arrays of the states, feed terms (P or CSL) and number of damped terms. 
+    feed=np.where(model['damped'],np.append(model['feed'],1.0)[model['state']],1.0) 
+    model['irct']=xidx[:,:w] 
+    model['iprd']=xidx[:,w:] 
+    model['fd']=np.prod(feed[:,:w],axis=1) 
+    model['fi']=np.prod(feed[:,w:],axis=1) 
+    model['nd']=model['damped'][:,:w].sum(axis=1) 
+    model['ni']=model['damped'][:,w:].sum(axis=1) 
+     
+    # Stoichiometry of the species with differential equations; repeated states add up. 
+    rows,slots=np.nonzero(xidx<n) 
+    model['stoich']=sparse.csr_matrix((np.where(slots<w,-1.0,1.0),(xidx[rows,slots],rows)),
+                                      shape=(n,nrxn)) 
+      
+    # Kinetic constants 
+    model['T']=float(conf['Reactor']['reactortemp'])
+    model['kd'],model['ki']=rate_constants(conf,model,model['T'])
+      
+    # Pressure damping, the numeric counterpart of get_damptime 
+    try :          
+        model['damptime']=float(conf['Reactor']['damptime'])   
+    except :   
+        model['damptime']=1.0   
+      
+    # Clipped activation energies, for the constants that change along the integration. 
+    if 'lateral' in model or 'program' in model : 
+        model['ea0']=np.maximum(0.0,np.maximum(model['aGd'],model['dGd'])), \
+                     np.maximum(0.0,np.maximum(model['aGi'],-model['dGd'])) 
+     
+    # Programmed reactor: prefactors without their temperature dependence, stacked for the direct 
+    # and reverse semireactions, and the feed of each slot (nitm: none), see programmed_constants. 
+    if 'program' in model : 
+        area=float(conf['Catalyst']['areaactivesite']) 
+        gas=np.concatenate((model['gasd'],model['gasi']))>0 
+        mw=np.where(gas,np.concatenate((model['mwd'],model['mwi'])),1.0) 
+        model['ea']=np.concatenate(model['ea0']) 
+        model['hk']=np.where(gas,101325*area*1E-20/np.sqrt(2*np.pi*1.6605390400E-27*mw*1.3806485200E-23),0.0) 
+        model['surface']=~gas 
+        feedstate=np.where(model['damped'],model['state'],len(model['itm'])) 
+        model['feedstate']=np.vstack((feedstate[:,:w],feedstate[:,w:])) 
+     
+    # Lateral interactions on the coverages x[:n+1] (the site-balance species is x[n]). 
+    if 'lateral' in model : 
+        nitm=len(model['itm']) 
+        cat=np.nonzero(xidx_itm<=n)[0] 
+        cov=sparse.csr_matrix((np.ones(cat.shape[0]),(cat,xidx_itm[cat])),shape=(nitm,n+1)) 
+        # dGd, aGd, aGi stacked: one matrix-vector product per evaluation, see lateral_energies. 
+        model['latmat']=sparse.vstack([m.dot(cov) for m in model['latrxn']]).tocsr() 
+        model['lat0']=np.concatenate((model['dGd'],model['aGd'],model['aGi'])) 
+        # Chain rule on csbs=1-sum(c): d/dc=d/dx[:n]-d/dx[n] 
+        model['latelim']=sparse.vstack([sparse.identity(n),-np.ones((1,n))]).tocsr() 
+     
+    # Sparsity pattern of the analytical Jacobian 
+    jacobian_pattern(model) 
+    return model 
+     
+     
+def vibrational_lnq(model,T,cache=True) : 
+    """Logarithm of the harmonic vibrational partition functions of all intermediates and 
+    transition states, ln q=sum(-ln(1-exp(-hc·nu/kB·T))), minus hc·nu/2kB·T per mode if zpe, 
+    in one vectorized pass over all modes and temperatures. 
+    Results are kept in vibrationdata by (model['vibkey'], T); only new temperatures are evaluated. 
+     
+    Args: 
+        model: Compiled model with vibrational modes, see compile_model. 
+        T: Temperature in K, or array of temperatures. 
+        cache: False for temperatures that are not repeated, e.g. in programmed reactors. 
+     
+    Returns: 
+        lnq: Array of shape T.shape+(nitm+nrxn,): intermediates first, then transition states. 
+    """
+    T=np.asarray(T,dtype=float) 
+    new=np.array(sorted({t for t in T.ravel().tolist() if not cache or (model['vibkey'],t) not in vibrationdata})) 
+    if new.shape[0] : 
+        x=float(hck)*model['nu']/new[:,None] 
+        terms=-np.log1p(-np.exp(-x)) 
+        if model['zpe'] : 
+            terms-=x/2 
+        nspecies=len(model['itm'])+len(model['rxn']) 
+        slots=np.arange(new.shape[0])[:,None]*nspecies+model['modeof'] 
+        lnqs=np.bincount(slots.ravel(),weights=terms.ravel(), 
+                         minlength=new.shape[0]*nspecies).reshape(new.shape[0],nspecies) 
+        if not cache : 
+            return lnqs[np.searchsorted(new,T.ravel())].reshape(T.shape+(-1,)) 
+        for t,lnq in zip(new.tolist(),lnqs) : 
+            vibrationdata[model['vibkey'],t]=lnq 
+    return np.array([vibrationdata[model['vibkey'],t] for t in T.ravel().tolist()]).reshape( 
+        T.shape+(-1,)) 
+     
+     
+def vibrational_ratios(model,lnq) : 
+    """Ratios q(TS)/q(IS) and q(TS)/q(FS) of the vibrational partition functions of each 
+    reaction, from the lnq of vibrational_lnq (conditions along the first axes). 
+    """
+    nitm=len(model['itm']) 
+    lnqs=np.where(model['state']>=0,lnq[...,np.maximum(model['state'],0)],0.0) 
+    lnqTS=lnq[...,nitm:] 
+    w=model['state'].shape[1]//2 
+    return [np.exp(lnqTS-lnqs[...,:w].sum(axis=-1)),np.exp(lnqTS-lnqs[...,w:].sum(axis=-1))] 
+     
+     
+def rate_constants(conf,model,T,elecpot=None) : 
+    """Kinetic constants of all direct and reverse semireactions, evaluated at once with the 
+    same formulae printed by kinetic_constants, for one or many conditions. 
+    With [Vibrations], surface prefactors carry the ratio of vibrational partition functions 
+    of the transition and initial states, see vibrational_lnq. 
+    Energies are shifted from the potential of the model to elecpot as in 
+    adjust_energy_with_potential: G+ne*(elecpot-model['elecpot']). 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Compiled model, see compile_model. 
+        T: Temperature in K, or array of temperatures. 
+        elecpot: Electric potential vs SHE, or array broadcastable with T. 
+            Default: the one of the model. See rhe_to_she. 
+     
+    Returns: 
+        kd, ki: Direct and reverse kinetic constants, arrays of shape (nrxn) for a single 
+            condition or (nconditions, nrxn) for arrays of conditions. 
+    """
+    area=float(conf['Catalyst']['areaactivesite'])
+    if elecpot is None : 
+        elecpot=model['elecpot'] 
+    T,elecpot=np.broadcast_arrays(np.asarray(T,dtype=float),np.asarray(elecpot,dtype=float))
+    T=T[...,None]  # Conditions along the first axis, reactions along the last one. 
+    shift=elecpot[...,None]-model['elecpot'] 
+    dGd=model['dGd']+(model['nei']-model['ned'])*shift 
+    aGd=model['aGd']+(model['neTS']-model['ned'])*shift 
+    aGi=model['aGi']+(model['neTS']-model['nei'])*shift 
+    kbt=float(kbev)*T 
+    # Vibrational partition functions: q(TS)/q(IS) and q(TS)/q(FS) on the surface prefactors. 
+    qratio=[1.0,1.0] 
+    if 'vibkey' in model : 
+        qratio=vibrational_ratios(model,vibrational_lnq(model,T[...,0])) 
+    k=[]
+    for ea,gas,mw,q in [(np.maximum(0.0,np.maximum(aGd, dGd)),model['gasd']>0,model['mwd'],qratio[0]), 
+                        (np.maximum(0.0,np.maximum(aGi,-dGd)),model['gasi']>0,model['mwi'],qratio[1])] : 
+        # Arrhenius kb*T/h on surface; Hertz-Knudsen if a gas-phase species is involved. 
+        pref=np.where(gas,
+                      101325*area*1E-20/np.sqrt(2*np.pi*1.6605390400E-27*np.where(gas,mw,1.0)*
+                                                1.3806485200E-23*T),
+                      float(kbh)*T*q)
+        k.append(pref*np.exp(-ea/kbt))
+    return k[0], k[1]
+     
+     
+def extended_state(y) : 
+    """Returns x=[y,csbs,1.0], closing the site balance. 
+    """
+    x=np.empty(y.shape[0]+2)
+    x[:-2]=y 
+    x[-2]=1.0-y.sum()   # Site balance 
+    x[-1]=1.0 
+    return x 
+     
+     
+def programmed_temperature(model,t) : 
+    """Temperature of a programmed reactor at time t; the one of the model if not programmed. 
+    """
+    if model.get('program',{}).get('T') is None : 
+        return model['T'] 
+    return float(program_value(model['program']['T'],t)) 
+     
+     
+def programmed_feeds(model,t) : 
+    """Pressures and concentrations of all intermediates (zero for adsorbed ones) at time t, 
+    in the units of model['feed']. 
+    """
+    feed=model['feed'].copy() 
+    for i,program,factor in model.get('program',{}).get('feed',[]) : 
+        feed[i]=float(program_value(program,t))*factor 
+    return feed 
+     
+     
+def programmed_constants(model,t) : 
+    """Kinetic constants times pressures/concentrations of a programmed reactor at time t, 
+    the formulae of rate_constants on the activation energies and prefactors cached by 
+    compile_network: a single exponential over all the semireactions. 
+     
+    Returns: 
+        kd, ki: Direct and reverse constants, undamped. 
+        T: Temperature at time t. 
+    """
+    T=programmed_temperature(model,t) 
+    feed=np.append(programmed_feeds(model,t),1.0)[model['feedstate']] 
+    q=1.0 
+    if 'vibkey' in model : 
+        q=np.concatenate(vibrational_ratios(model,vibrational_lnq(model,T,cache=False))) 
+    # Arrhenius kb*T/h on surface; Hertz-Knudsen if a gas-phase species is involved. 
+    pref=np.where(model['surface'],float(kbh)*T*q,model['hk']/np.sqrt(T)) 
+    k=pref*np.exp(-model['ea']/(float(kbev)*T))*np.prod(feed,axis=1) 
+    kd,ki=np.split(k,2) 
+    return kd, ki, T 
+     
+     
+def effective_constants(model,t,x=None) : 
+    """Kinetic constants times pressures/concentrations and their damping at time t; 
+    with lateral interactions, also corrected for the coverages of the extended state x. 
+    In programmed reactors, evaluated at the temperature and feeds of time t. 
+    """
+    if model['damptime']>1E-13 : 
+        damp=(1-np.exp(-model['damptime']*t))**2 
+    else : 
+        damp=1.0 
+    if 'program' in model : 
+        kd,ki,T=programmed_constants(model,t) 
+    else : 
+        kd,ki,T=model['kd']*model['fd'],model['ki']*model['fi'],model['T'] 
+    kd=kd*damp**model['nd'] 
+    ki=ki*damp**model['ni'] 
+    if x is not None and 'latmat' in model : 
+        # Change of the activation energies with the coverages, see lateral_energies. 
+        kbt=float(kbev)*T 
+        ead,eai=lateral_energies(model,x)[:2] 
+        kd=kd*np.exp(-(ead-model['ea0'][0])/kbt) 
+        ki=ki*np.exp(-(eai-model['ea0'][1])/kbt) 
+    return kd, ki 
+     
+     
+def lateral_energies(model,x) : 
+    """Activation energies of the direct and reverse semireactions at the coverages x[:n+1], 
+    with the lateral interactions of compile_network (see lateral_reactions): dGd, aGd and aGi change linearly with 
+    the coverages, in one sparse matrix-vector product, and are clipped as in rate_constants. 
+     
+    Returns: 
+        ead, eai: Activation energies, max(0,aGd,dGd) and max(0,aGi,-dGd). 
+        branches: Where each maximum is dGd, aGd, -dGd, and aGi; for the derivatives. 
+    """
+    dGd,aGd,aGi=np.split(model['lat0']+model['latmat'].dot(x[:-1]),3) 
+    ead=np.maximum(0.0,np.maximum(aGd, dGd)) 
+    eai=np.maximum(0.0,np.maximum(aGi,-dGd)) 
+    ond=(ead>0)&(aGd>=dGd) 
+    oni=(eai>0)&(aGi>=-dGd) 
+    return ead, eai, ((ead>0)&~ond, ond, (eai>0)&~oni, oni) 
+     
+     
+def fluxes(model,t,y) : 
+    """Rates of the direct and reverse semireactions for the surface concentrations y at time t. 
+    """
+    x=extended_state(y) 
+    kd,ki=effective_constants(model,t,x) 
+    return kd*np.prod(x[model['irct']],axis=1), ki*np.prod(x[model['iprd']],axis=1) 
+     
+     
+def rates(model,t,y) : 
+    """Rates of all reactions for the surface concentrations y at time t. 
+    """
+    rd,ri=fluxes(model,t,y) 
+    return rd-ri 
+     
+     
+def rhs(t,y,model) : 
+    """Right-hand side of the SODE: one sparse matrix-vector product over the rates. 
+    """
+    return model['stoich'].dot(rates(model,t,y)) 
+     
+     
+def jacobian_pattern(model) : 
+    """Computes once the sparsity pattern of the Jacobian of rhs and the map from the 
+    derivatives of each rate to the positions of the CSR data array. 
+     
+    Each rate depends on the w elements of x of each semireaction (slots), so 
+    J[i,c]=sum_j S[i,j]*dr_j/dx_c. The site-balance species is eliminated through 
+    csbs=1-sum(c), so the slots pointing to it contribute -dr_j/dcsbs to every column: 
+    rows of species reacting with the site-balance species are full. 
+     
+    Args: 
+        model: Model from compile_network. Expanded with the pattern. (Mutable)
+    """
+    from scipy import sparse 
+      
+    n=model['dyn'].shape[0]
+    stoich=model['stoich'].tocoo()
+    # Columns of the 2w slots of every reaction: [irct0,irct1,...,iprd0,iprd1,...] 
+    slots=np.hstack((model['irct'],model['iprd']))
+    nslots=slots.shape[1] 
+    # Every (nonzero of S, slot) pair 
+    nnzs=stoich.row.shape[0] 
+    row=np.repeat(stoich.row,nslots)
+    col=slots[stoich.col].ravel()
+    sgn=np.repeat(stoich.data,nslots)
+    val=(nslots*np.repeat(stoich.col,nslots)+np.tile(np.arange(nslots),nnzs))
+    # Rows that become full because of the site balance 
+    sbsrow=np.unique(row[col==n])
+    dyn=col<n 
+    keys=np.unique(np.concatenate((row[dyn]*n+col[dyn],
+                   (sbsrow[:,None]*n+np.arange(n)[None,:]).ravel()))) 
+    model['jac']=sparse.csr_matrix((np.zeros(keys.shape[0]),(keys//n,keys%n)),shape=(n,n))
+    model['jacrow']=keys//n                                   # Row of each data element 
+    model['jacpos']=np.searchsorted(keys,row[dyn]*n+col[dyn]) # Position in data 
+    model['jacsgn']=sgn[dyn]
+    model['jacval']=val[dyn]                                  # Element of the derivatives 
+    model['sbssgn']=sgn[col==n]
+    model['sbsrow']=row[col==n]
+    model['sbsval']=val[col==n]
+     
+     
+def slot_derivatives(v) : 
+    """Derivatives of the products of the rows of v, np.prod(v,axis=1), with respect to each 
+    element: products of the other elements of the row, without divisions (v may be zero). 
+    """
+    ones=np.ones((v.shape[0],1)) 
+    left=np.cumprod(np.hstack((ones,v[:,:-1])),axis=1) 
+    right=np.cumprod(np.hstack((ones,v[:,:0:-1])),axis=1)[:,::-1] 
+    return left*right 
+     
+     
+def jacobian(t,y,model) : 
+    """Exact Jacobian of rhs as a CSR matrix with the fixed pattern of jacobian_pattern. 
+    Lateral interactions add S*dr/dx, a sparse product whose pattern follows the active 
+    branches of the activation energies (see lateral_energies). 
+    """
+    x=extended_state(y) 
+    kd,ki=effective_constants(model,t,x) 
+    irct=model['irct'] 
+    iprd=model['iprd'] 
+    # Derivatives of each rate with respect to its 2w slots 
+    drdx=np.hstack((kd[:,None]*slot_derivatives(x[irct]),
+                   -ki[:,None]*slot_derivatives(x[iprd]))).ravel()
+    jac=model['jac'].copy() 
+    jac.data=np.bincount(model['jacpos'],weights=model['jacsgn']*drdx[model['jacval']],
+                         minlength=jac.data.shape[0])
+    # Site-balance species, chain rule on csbs=1-sum(c) 
+    gsbs=np.bincount(model['sbsrow'],weights=model['sbssgn']*drdx[model['sbsval']],
+                     minlength=jac.shape[0])
+    jac.data-=gsbs[model['jacrow']]
+    if 'latmat' in model : 
+        drdx=lateral_derivatives(model,t,x,kd,ki) 
+        jac=(jac+model['stoich'].dot(drdx).dot(model['latelim'])).tocsr() 
+    return jac 
+     
+     
+def lateral_derivatives(model,t,x,kd,ki) : 
+    """Derivatives of the rates through the lateral interactions, with respect to x[:n+1]: 
+    dr/dx=-(rd*dead/dx-ri*deai/dx)/kB*T through the active branches, see lateral_energies. 
+    kd, ki are the effective constants at t and x. Returns a sparse (nrxn, n+1) matrix. 
+    """
+    nrxn=len(model['rxn']) 
+    kbt=float(kbev)*programmed_temperature(model,t) 
+    rd,ri=kd*np.prod(x[model['irct']],axis=1),ki*np.prod(x[model['iprd']],axis=1) 
+    Gd,Ad,Gi,Ai=lateral_energies(model,x)[2] 
+    w=np.concatenate((-(rd*Gd+ri*Gi),-rd*Ad,ri*Ai))/kbt 
+    drdx=model['latmat'].multiply(w[:,None]).tocsr() 
+    return drdx[:nrxn]+drdx[nrxn:2*nrxn]+drdx[2*nrxn:] 
+     
+     
+def write_jacobian(filename,t,y,model) : 
+    """Exports the Jacobian at time t and concentrations y as an explicit sparse 
+    matrix in MatrixMarket format. Rows and columns follow model['dyn']. 
+    """
+    from scipy import io 
+    labels=[model['itm'][i] for i in model['dyn']] 
+    io.mmwrite(filename,jacobian(t,y,model),
+               comment=" ".join(["Jacobian at t=",repr(float(t)),":"]+labels)) 
+     
+     
+def rhs_module_key(model) : 
+    """Hash of everything printed by printpy: labels, index arrays, stoichiometry, constants, 
+    and this library. Names the generated module and decides if it must be written again. 
+    """
+    import hashlib 
+    h=hashlib.sha256() 
+    with open(__file__,'rb') as f : 
+        h.update(f.read()) 
+    h.update(repr((model['itm'],model['rxn'],model['sbs'],model['damptime'])).encode()) 
+    stoich=model['stoich'].tocoo() 
+    for array in [model['dyn'],model['irct'],model['iprd'],model['kd'],model['ki'],model['fd'], 
+                  model['fi'],model['nd'],model['ni'],stoich.row,stoich.col,stoich.data] : 
+        h.update(np.ascontiguousarray(array).tobytes()) 
+    return h.hexdigest() 
+     
+     
+def printpy(conf,model,out,key='') : 
+    """Prints the network as a standalone Python module, the counterpart of the Maple input 
+    of printtxt: constants, pressures/concentrations, rates, differential equations and site 
+    balance, written as flat NumPy code on index arrays; numbers are exact (repr). 
+    The module only needs numpy and defines rates(t,y), rhs(t,y), and jacobian(t,y) (dense), 
+    with y the concentrations of the species in "labels". 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        out: Stream where the module is written. 
+        key: Model hash, see rhs_module_key. 
+    """
+    write=functools.partial(print,file=out) 
+    def array(values,dtype='float') : 
+        values=[repr(value) for value in np.asarray(values).ravel().tolist()] 
+        lines=[", ".join(values[k:k+6]) for k in range(0,len(values),6)] 
+        return "np.array([\n    " + ",\n    ".join(lines) + "],dtype="+dtype+")" 
+    stoich=model['stoich'].tocoo() 
+    n=model['dyn'].shape[0] 
+      
+    write("# -*- coding: utf-8 -*-") 
+    write('"""Microkinetic model of '+conf['Catalyst']['name'].replace('"','')+ 
+          ' generated by amklib.printpy; edit at will.') 
+    write("State y: concentrations of the species in labels; x=[y, site-balance species, 1.0].") 
+    write("Model hash: "+key) 
+    write('"""') 
+    write("import numpy as np \n") 
+    write("labels="+repr([model['itm'][i] for i in model['dyn']])) 
+    write("reactions="+repr(list(model['rxn']))) 
+    write("sitebalancespecies="+repr(conf['Catalyst']['sitebalancespecies'])) 
+    write("n="+str(n)+" \n") 
+      
+    write("# Temperature and pressure damping") 
+    write("T="+repr(model['T'])) 
+    write("damptime="+repr(model['damptime'])+" \n") 
+      
+    write("# Kinetic constants of the direct and reverse semireactions") 
+    write("kd="+array(model['kd'])) 
+    write("ki="+array(model['ki'])+" \n") 
+      
+    write("# Pressures/concentrations of each semireaction, and how many of them are damped") 
+    write("fd="+array(model['fd'])) 
+    write("fi="+array(model['fi'])) 
+    write("nd="+array(model['nd'],'int')) 
+    write("ni="+array(model['ni'],'int')+" \n") 
+      
+    write("# Reaction rates: positions in x of the initial and final states") 
+    write("irct="+array(model['irct'],'int')+".reshape(-1,"+str(model['irct'].shape[1])+")") 
+    write("iprd="+array(model['iprd'],'int')+".reshape(-1,"+str(model['iprd'].shape[1])+") \n") 
+      
+    write("# Differential equations: dy[row]/dt+=coef*r[col]") 
+    write("row="+array(stoich.row,'int')) 
+    write("col="+array(stoich.col,'int')) 
+    write("coef="+array(stoich.data)+" \n") 
+      
+    write("""
+def site_balance(y) : 
+    return 1.0-y.sum() 
+ 
+def constants(t) :  # Constants times pressures/concentrations, damped at time t. 
+    damp=(1-np.exp(-damptime*t))**2 if damptime>1E-13 else 1.0 
+    return kd*fd*damp**nd, ki*fi*damp**ni 
+ 
+def rates(t,y) : 
+    x=np.concatenate((y,[site_balance(y),1.0])) 
+    kdt,kit=constants(t) 
+    return kdt*np.prod(x[irct],axis=1)-kit*np.prod(x[iprd],axis=1) 
+ 
+def rhs(t,y) : 
+    return np.bincount(row,weights=coef*rates(t,y)[col],minlength=n) 
+ 
+def others(v) :  # Products of the other elements of each row: derivatives of np.prod(v,axis=1). 
+    ones=np.ones((v.shape[0],1)) 
+    return (np.cumprod(np.hstack((ones,v[:,:-1])),axis=1)* 
+            np.cumprod(np.hstack((ones,v[:,:0:-1])),axis=1)[:,::-1]) 
+ 
+def jacobian(t,y) :  # Dense; the site balance enters through the column of x[n]. 
+    x=np.concatenate((y,[site_balance(y),1.0])) 
+    kdt,kit=constants(t) 
+    slots=np.hstack((irct,iprd)) 
+    drdx=np.hstack((kdt[:,None]*others(x[irct]),-kit[:,None]*others(x[iprd]))) 
+    J=np.bincount((row[:,None]*(n+2)+slots[col]).ravel(),weights=(coef[:,None]*drdx[col]).ravel(), 
+                  minlength=n*(n+2)).reshape(n,n+2) 
+    return J[:,:n]-J[:,[n]] 
+""") 
+     
+     
+def rhs_module(conf,model) : 
+    """Imports the module of printpy for the network, written to the file of the module option 
+    of [Solver] only if it does not exist or its model hash differs, so repeated runs (and edits 
+    of an unchanged model) import it directly; Python keeps its bytecode in __pycache__. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. Records the file as model['rhsmodule']. (Mutable) 
+     
+    Returns: 
+        module: The imported module. 
+    """
+    import importlib.util 
+    if 'latmat' in model : 
+        print("Lateral interactions are not supported by the Module backend; use Python.") 
+        exit() 
+    if 'program' in model : 
+        print("Programmed reactors are not supported by the Module backend; use Python.") 
+        exit() 
+    filename=get_solver(conf)['module'] 
+    key=rhs_module_key(model) 
+    name='amkrhs_'+key[:16] 
+    model['rhsmodule']=filename,name 
+    if name in sys.modules : 
+        return sys.modules[name] 
+    current=False 
+    if os.path.isfile(filename) : 
+        with open(filename) as f : 
+            current=any(line.strip()=="Model hash: "+key for line in f) 
+    if not current : 
+        buf=io.StringIO() 
+        printpy(conf,model,buf,key) 
+        with open(filename+'.tmp','w') as f : 
+            f.write(buf.getvalue()) 
+        os.replace(filename+'.tmp',filename) 
+    spec=importlib.util.spec_from_file_location(name,filename) 
+    module=importlib.util.module_from_spec(spec) 
+    spec.loader.exec_module(module) 
+    sys.modules[name]=module 
+    return module 
+     
+     
+def get_quasiequilibrium(conf) : 
+    """Threshold in s^-1 of the quasi-equilibrium collapse, from [Reduction] quasiequilibrium. 
+    Zero (default) disables it. See compile_quasi_equilibrium. 
+    """
+    if conf.has_option('Reduction','quasiequilibrium') : 
+        return float(conf['Reduction']['quasiequilibrium']) 
+    return 0.0 
+     
+     
+def compile_quasi_equilibrium(conf,model) : 
+    """Finds the steps faster than the threshold of get_quasiequilibrium and replaces them by 
+    equilibrium relations, rd=ri. Each fast step gets a pivot species (greedily, fastest steps 
+    first, keeping the stoichiometry B of the pivots in the fast steps invertible). Thresholds 
+    that leave a fast step kinetic (irreversible, or without a valid pivot) or that fall 
+    within a factor 100 of the steps left are refused: the system would stay stiff, or the 
+    equilibria would be poor. The other species O evolve through the combinations 
+    z=c_O-M*c_P, M=S_OF*inv(B), in which the fast steps cancel: dz/dt=f_O-M*f_P, with f the 
+    rhs of the slow steps alone. The pivots follow from z by solving the equilibria, see 
+    quasi_equilibrium_state. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. Expanded with the arrays of the collapse. (Mutable)
+     
+    Returns: 
+        model: With fast (indices of the collapsed steps, empty if none), pivot, other, 
+            qeB, qeM, and slow (the model without the fast steps). (Mutable)
+    """
+    threshold=get_quasiequilibrium(conf) 
+    if threshold>0 and 'lateral' in model : 
+        print("Quasi-equilibrium is not supported with lateral interactions.") 
+        exit() 
+    if threshold>0 and 'program' in model : 
+        print("Quasi-equilibrium is not supported in programmed reactors.") 
+        exit() 
+    n=model['dyn'].shape[0] 
+    stoich=model['stoich'].tocsc() 
+    kd,ki=model['kd']*model['fd'],model['ki']*model['fi'] # Pseudo-first-order, undamped. 
+    fast=[] 
+    pivot=[] 
+    kinetic=[] # Steps faster than the threshold that cannot be collapsed. 
+    for j in np.argsort(-np.maximum(kd,ki),kind='stable') : 
+        if threshold<=0 or max(kd[j],ki[j])<=threshold : 
+            break 
+        # An irreversible step has no equilibrium, it drains its reactants. 
+        if kd[j]==0 or ki[j]==0 : 
+            kinetic.append(j) 
+            continue 
+        # Pivots preferably among the species consumed by the faster direction, whose equilibrium 
+        # concentrations follow from the others with the small ratio of the constants. 
+        column=stoich[:,j] 
+        side=column.data<0 if kd[j]>=ki[j] else column.data>0 
+        for p in np.hstack((column.indices[side],column.indices[~side])) : 
+            if p in pivot : 
+                continue 
+            B=stoich[pivot+[p]][:,fast+[j]].toarray() 
+            if np.linalg.matrix_rank(B)==len(fast)+1 : 
+                fast.append(j) 
+                pivot.append(p) 
+                break 
+        else : 
+            kinetic.append(j) 
+    # A fast step left in the differential equations keeps them as stiff as the full system, 
+    # and only adds the cost of the equilibria to each evaluation. 
+    if kinetic : 
+        print("Quasi-equilibrium: the steps",[model['rxn'][j] for j in kinetic],"are faster than", 
+              "{:.2E}".format(threshold),"s^-1 but irreversible or without an independent pivot,\n", 
+              "the reduction cannot remove the stiffness. Raise [Reduction] quasiequilibrium above", 
+              "{:.2E}".format(max(np.maximum(kd,ki)[kinetic]))) 
+        exit() 
+    # The equilibria hold to about the ratio of the time scales, the steps left must be slower. 
+    rate=np.maximum(kd,ki) 
+    left=rate.copy() 
+    left[fast]=-1.0 
+    if fast and rate[fast[-1]]<100*left.max() : 
+        print("Quasi-equilibrium: the slowest step collapsed,",model['rxn'][fast[-1]], 
+              "{:.2E}".format(rate[fast[-1]]),"s^-1, is not 100 times faster than the fastest step left,", 
+              model['rxn'][np.argmax(left)],"{:.2E}".format(left.max()), 
+              "s^-1.\n Choose [Reduction] quasiequilibrium in a wider gap of the rate constants.") 
+        exit() 
+    model['fast']=np.array(fast,dtype=int) 
+    model['pivot']=np.array(pivot,dtype=int) 
+    model['other']=np.setdiff1d(np.arange(n),model['pivot']) 
+    model['qeB']=stoich[pivot][:,fast].toarray() 
+    model['qeM']=np.linalg.solve(model['qeB'].T,stoich[model['other']][:,fast].toarray().T).T 
+    slow=np.ones(len(model['rxn'])) 
+    slow[fast]=0.0 
+    model['slow']=dict(model,kd=model['kd']*slow,ki=model['ki']*slow) 
+    model['qeguess']=np.zeros(len(pivot)) # Last pivots found, warm start of the next search. 
+    model['qertol']=get_solver(conf)['rtol'] # Tolerances of the equilibria on concentrations. 
+    model['qeatol']=get_solver(conf)['atol'] 
+    if threshold>0 : 
+        sys.stderr.write("Quasi-equilibrium: "+str(len(fast))+" of "+str(len(model['rxn']))+ 
+                         " steps collapsed, "+str(len(model['other']))+" differential equations left.\n") 
+    return model 
+     
+     
+def rate_derivatives(model,t,y,rows) : 
+    """Dense derivatives of the rates of the reactions in rows with respect to y, 
+    including the site balance csbs=1-sum(c) and the lateral interactions. See jacobian. 
+    """
+    n=y.shape[0] 
+    x=extended_state(y) 
+    kd,ki=effective_constants(model,t,x) 
+    irct=model['irct'][rows] 
+    iprd=model['iprd'][rows] 
+    slots=np.hstack((irct,iprd)) 
+    drdx=np.hstack((kd[rows][:,None]*slot_derivatives(x[irct]), 
+                   -ki[rows][:,None]*slot_derivatives(x[iprd]))) 
+    drdy=np.zeros((len(rows),n+2)) 
+    for k in range(slots.shape[1]) : 
+        np.add.at(drdy,(np.arange(len(rows)),slots[:,k]),drdx[:,k]) 
+    drdy=drdy[:,:n]-drdy[:,n][:,None] 
+    if 'latmat' in model : 
+        drdy+=lateral_derivatives(model,t,x,kd,ki)[rows].dot(model['latelim']).toarray() 
+    return drdy 
+     
+     
+def quasi_equilibrium_flux(model,kd,ki,y) : 
+    """Forward and reverse rates of the collapsed steps at y, and their sum, the scale of the 
+    equilibria (one where both vanish). 
+    """
+    fast=model['fast'] 
+    x=extended_state(y) 
+    rd=kd[fast]*np.prod(x[model['irct'][fast]],axis=1) 
+    ri=ki[fast]*np.prod(x[model['iprd'][fast]],axis=1) 
+    flux=np.abs(rd)+np.abs(ri) # Round-off negatives of the integrator. 
+    return rd, ri, np.where(flux>0,flux,1.0) 
+     
+     
+def quasi_equilibrium_state(model,t,z,maxiter=50) : 
+    """Concentrations of all the species with differential equations for the combinations z 
+    (see compile_quasi_equilibrium): damped Newton on the equilibria of the fast steps in 
+    the pivots, from the last solution found, keeping them non-negative. Each equilibrium is 
+    scaled by its gross rate |rd|+|ri|, so the imbalances are relative whatever the constants 
+    and tiny concentrations are resolved as well as large ones. If Newton fails (e.g. from a clean surface, where the 
+    equilibria are degenerate), the fast steps alone are relaxed first with pseudo_transient, 
+    which conserves z. 
+    """
+    from scipy import linalg 
+    n=model['dyn'].shape[0] 
+    fast,pivot,other,M=model['fast'],model['pivot'],model['other'],model['qeM'] 
+    kd,ki=effective_constants(model,t) 
+     
+    def residual(yP) : 
+        """Concentrations, net rates of the fast steps, and their scale.""" 
+        y=np.empty(n) 
+        y[other]=z+M.dot(yP) 
+        y[pivot]=yP 
+        rd,ri,flux=quasi_equilibrium_flux(model,kd,ki,y) 
+        return y, rd-ri, flux 
+     
+    def solve(yP) : 
+        """Damped Newton from yP. Returns the concentrations, pivots, and convergence. 
+        The integrator needs a smooth rhs, independent of the starting point: Newton goes on 
+        until the imbalances are at round-off or its steps far below the tolerance on the 
+        concentrations, and a search that stalls is accepted only there.""" 
+        y,g,flux=residual(yP) 
+        for iteration in range(maxiter) : 
+            D=rate_derivatives(model,t,y,fast) 
+            # Least squares: singular where the equilibria are degenerate (species at zero). 
+            step=linalg.lstsq((D[:,pivot]+D[:,other].dot(M))/flux[:,None],-g/flux,lapack_driver='gelsy')[0] 
+            tolerance=model['qertol']*np.abs(yP)+model['qeatol'] 
+            # The last step is always taken, the solution then follows z to second order. 
+            if np.all(np.abs(g)<=1E-13*flux) or np.all(np.abs(step)<=1E-4*tolerance) : 
+                yP=np.maximum(yP+step,0.0) 
+                return residual(yP)[0], yP, True 
+            # Halve the step until the imbalances, relative to the current rates, decrease. 
+            lam=1.0 
+            while lam>1E-3 : 
+                y1,g1,flux1=residual(np.maximum(yP+lam*step,0.0)) 
+                if np.linalg.norm(g1/flux)<np.linalg.norm(g/flux) : 
+                    break 
+                lam*=0.5 
+            else : 
+                return y, yP, bool(np.all(np.abs(g)<=1E-10*flux) or np.all(np.abs(step)<=1E-3*tolerance)) 
+            yP=np.maximum(yP+lam*step,0.0) 
+            y,g,flux=y1,g1,flux1 
+        return y, yP, False 
+     
+    y,yP,converged=solve(model['qeguess'].copy()) 
+    if not converged : 
+        # The fast steps alone, with the constants frozen at time t. 
+        mask=np.zeros(kd.shape[0]) 
+        mask[fast]=1.0 
+        fastmodel=dict(model,kd=kd*mask,ki=ki*mask,fd=1.0,fi=1.0,nd=0,ni=0) 
+        scale=kd[fast]+ki[fast] 
+        y,relaxed=pseudo_transient(fastmodel,np.maximum(y,0.0),1E-10,1E-20,1.0,dt=0.1/scale.max()) 
+        y,yP,converged=solve(y[pivot]) 
+    if converged : 
+        model['qeguess']=yP 
+    return y 
+     
+     
+def quasi_equilibrium_rhs(t,z,model) : 
+    """Right-hand side of the combinations z: dz/dt=f_O-M*f_P, slow steps only. 
+    """
+    f=rhs(t,quasi_equilibrium_state(model,t,z),model['slow']) 
+    return f[model['other']]-model['qeM'].dot(f[model['pivot']]) 
+     
+     
+def quasi_equilibrium_derivatives(model,t,y) : 
+    """Derivatives of the concentrations with respect to z on the equilibrium manifold, dy/dz. 
+    """
+    from scipy import linalg 
+    fast,pivot,other,M=model['fast'],model['pivot'],model['other'],model['qeM'] 
+    dydz=np.empty((y.shape[0],other.shape[0])) 
+    if other.shape[0]==0 : 
+        return dydz 
+    # Scaled as the equilibria in quasi_equilibrium_state. 
+    kd,ki=effective_constants(model,t) 
+    D=rate_derivatives(model,t,y,fast)/quasi_equilibrium_flux(model,kd,ki,y)[2][:,None] 
+    dPdz=-linalg.lstsq(D[:,pivot]+D[:,other].dot(M),D[:,other],lapack_driver='gelsy')[0] 
+    dydz[pivot]=dPdz 
+    dydz[other]=np.eye(other.shape[0])+M.dot(dPdz) 
+    return dydz 
+     
+     
+def quasi_equilibrium_jacobian(t,z,model) : 
+    """Dense Jacobian of quasi_equilibrium_rhs, by the chain rule through dy/dz. 
+    """
+    y=quasi_equilibrium_state(model,t,z) 
+    J=jacobian(t,y,model['slow']).toarray() 
+    J=J[model['other']]-model['qeM'].dot(J[model['pivot']]) 
+    return J.dot(quasi_equilibrium_derivatives(model,t,y)) 
+     
+     
+def quasi_equilibrium_rates(model,t,y) : 
+    """Net rates of the collapsed steps, those keeping the pivots in equilibrium: 
+    B*r_F=dc_P/dt-f_P, with dc_P/dt=(dy/dz)_P*dz/dt. The explicit time dependence of the 
+    equilibria through the pressure damping is neglected. 
+    """
+    pivot,other,M=model['pivot'],model['other'],model['qeM'] 
+    f=rhs(t,y,model['slow']) 
+    dzdt=f[other]-M.dot(f[pivot]) 
+    dPdt=quasi_equilibrium_derivatives(model,t,y)[pivot].dot(dzdt) 
+    return np.linalg.solve(model['qeB'],dPdt-f[pivot]) 
+     
+     
+def diff_terms(model,i,skip=()) : 
+    """Terms of the Maple differential equation of intermediate i, as process_rxn: 
+    -r<item>(t) where it is consumed, +r<item>(t) where it is formed. 
+    Reactions with an index in skip are left out. 
+    """
+    w=model['state'].shape[1]//2 
+    rows,slots=np.nonzero(model['state']==i) 
+    return [("-" if k<w else "+")+"r"+model['rxn'][j]+"(t)" for j,k in zip(rows,slots) if j not in skip] 
+     
+     
+def quasi_equilibrium_maple(conf,model,itm,initialc,sodesolv) : 
+    """Rewrites the Maple SODE as the DAE of the quasi-equilibrium collapse (see 
+    compile_quasi_equilibrium): the equation of each pivot becomes the equilibrium 0=r(t) of 
+    its fast step, and those of the other species d(c_O-M*c_P)/dt=f_O-M*f_P, without the fast 
+    steps. The initial conditions are those in equilibrium with the clean surface. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        itm: Dict of dicts with the differential equations, see process_rxn. (Mutable)
+        initialc: Initial conditions, string. 
+        sodesolv: Calls SODE solver in Maple, string. 
+     
+    Returns: 
+        itm, initialc, sodesolv: Updated for the DAE; unchanged if no step is fast enough. 
+    """
+    compile_quasi_equilibrium(conf,model) 
+    if model['fast'].shape[0]==0 : 
+        return itm, initialc, sodesolv 
+    fast,pivot,other,M=model['fast'],model['pivot'],model['other'],model['qeM'] 
+    dyn=model['dyn'] 
+    label=[model['itm'][i] for i in dyn] 
+    slow=[diff_terms(model,i,set(fast)) for i in dyn] 
+    for b,p in enumerate(pivot) : 
+        itm[label[p]]['diff']="eqd"+label[p]+":=0=r"+model['rxn'][fast[b]]+"(t)" 
+    for a,o in enumerate(other) : 
+        lhs=["diff(c"+label[o]+"(t),t)"] 
+        rhs=slow[o][:] 
+        for b in np.nonzero(M[a])[0] : 
+            coef=("-" if M[a,b]>0 else "+")+"{:.16E}".format(abs(M[a,b]))+"*" 
+            lhs.append(coef+"diff(c"+label[pivot[b]]+"(t),t)") 
+            if slow[pivot[b]] : 
+                rhs.append(coef+"("+"".join(slow[pivot[b]])+")") 
+        itm[label[o]]['diff']="eqd"+label[o]+":="+"".join(lhs)+"="+("".join(rhs) if rhs else "0") 
+     
+    y0=quasi_equilibrium_state(model,0.0,np.zeros(other.shape[0])) 
+    initialc="IC0:="+",".join([" c"+label[k]+"(0.0)="+"{:.16E}".format(y0[k]) 
+                              for k in range(dyn.shape[0])])+" : " 
+    sodesolv=sodesolv.replace("method=rosenbrock,","method=rosenbrock_dae,") 
+    return itm, initialc, sodesolv 
+     
+     
+def solve_sode(conf,model,ltp,filenames=inputfiles) : 
+    """Integrates the network in-process with a stiff method of scipy and writes  
+    the same columns as the Maple input generated by printtxt. 
+    With a [Checkpoint] section, each row is written as soon as its time is reached and 
+    the state is checkpointed; a restarted run resumes from the last completed time. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        ltp: List-to-print dictionary of lists. 
+        filenames: Input files of the network, for the key of the checkpoint. 
+    """
+    filename=get_checkpoint(conf) 
+    if not filename : 
+        time1,y=integrate_sode(conf,model) 
+        write_results(conf,model,ltp,time1,y) 
+        return 
+     
+    key=checkpoint_key(conf,filenames) 
+    checkpoint=checkpoint_load(filename,key) 
+    time1,timel=rxntime(conf) 
+    time1=list(np.array(time1 if timel else [time1],dtype=float)) 
+    header,rows=results_table(conf,model,ltp,[],np.zeros((model['dyn'].shape[0],0))) 
+    if checkpoint is None : 
+        checkpoint={'key':key, 't':0.0, 'state':None, 'step':None, 'rows':[]} 
+    # Rows already written are taken from the checkpoint, never duplicated. 
+    out=open(get_outputfile(conf),'w') 
+    out.write(', '.join(header)+"\n") 
+    for row in checkpoint['rows'] : 
+        out.write(', '.join(row)+"\n") 
+    out.flush() 
+     
+    def segment(t,y,state,step) : 
+        """Writes the rows of time t and checkpoints the state.""" 
+        rows=results_table(conf,model,ltp,[t]*time1.count(t),np.tile(y[:,None],time1.count(t)))[1] 
+        for row in rows : 
+            out.write(', '.join(row)+"\n") 
+        out.flush() 
+        checkpoint.update(t=t,state=state,step=step,rows=checkpoint['rows']+rows) 
+        checkpoint_store(filename,checkpoint) 
+     
+    resume=None 
+    if checkpoint['state'] is not None : 
+        resume=checkpoint['t'],checkpoint['state'],checkpoint['step'] 
+    integrate_sode(conf,model,resume,segment) 
+    out.close() 
+    if get_binaryoutput(conf) : 
+        write_columns(get_binaryoutput(conf),header,checkpoint['rows']) 
+     
+     
+def integrate_sode(conf,model,resume=None,segment=None) : 
+    """Integrates the network in-process from the clean surface with a stiff method of scipy, 
+    segment by segment between consecutive times. Each segment starts with the last step 
+    size of the previous one, and from the previous state without roundoff negatives. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        resume: (time, state, step size) to continue from, as passed to segment. 
+        segment: Called as segment(t,y,state,step) after each segment, with the integrated 
+            state (y, or the combinations z of the quasi-equilibrium collapse). 
+     
+    Returns: 
+        time1: List of times, after the one of resume. 
+        y: Concentrations of the species with differential equations, one column per time. 
+    """
+    from scipy import integrate 
+    import time 
+      
+    solver=get_solver(conf) 
+    time1,timel=rxntime(conf) 
+    if not timel : 
+        time1=[float(time1)] 
+    times=np.unique(np.array(time1,dtype=float))
+    n=model['dyn'].shape[0] 
+      
+    # Analytical Jacobian; LSODA only accepts dense matrices. 
+    if   solver['jacobian']!='Analytical' : 
+        jac=None 
+    elif solver['method']=='LSODA' : 
+        jac=lambda t,y,model : jacobian(t,y,model).toarray() 
+    else : 
+        jac=jacobian 
+    fun=rhs 
+    if solver['backend']=='Module' : 
+        module=rhs_module(conf,model) 
+        fun=lambda t,y,model : module.rhs(t,y) 
+        if solver['jacobian']=='Analytical' : 
+            jac=lambda t,y,model : module.jacobian(t,y) 
+    state=lambda t,u : u 
+    restart=lambda u : np.maximum(u,0.0) # Roundoff negatives grow when BDF restarts at order 1. 
+      
+    # Quasi-equilibrium collapse of the fastest steps: integrate the combinations z instead. 
+    if get_quasiequilibrium(conf)>0 and 'fast' not in model : 
+        compile_quasi_equilibrium(conf,model) 
+    if get_quasiequilibrium(conf)>0 and model['fast'].shape[0]>0 : 
+        jac=quasi_equilibrium_jacobian if solver['jacobian']=='Analytical' else None 
+        fun=quasi_equilibrium_rhs 
+        state=lambda t,u : quasi_equilibrium_state(model,t,u) 
+        restart=lambda u : u 
+        n=model['other'].shape[0] 
+        model['qeguess']=np.zeros(model['fast'].shape[0]) 
+      
+    t,u,step=0.0,np.zeros(n),None 
+    if resume is not None : 
+        t,u,step=resume 
+        times=times[times>t] 
+    y=[] 
+    for timei in times : 
+        # Nothing to integrate if every species is in equilibrium, or at the initial time. 
+        if n>0 and timei>t : 
+            # The method of [Solver], and Radau if it fails or exceeds maxfev evaluations, 
+            # e.g. BDF stalling on tiny steps near full coverage with lateral interactions. 
+            for method in [solver['method']]+(['Radau'] if solver['method']!='Radau' else []) : 
+                wall=time.perf_counter() 
+                nfev=[0] 
+                def segfun(s,u,model) : 
+                    # Time elapsed since t: steps are not bounded by the spacing of the floats around t. 
+                    nfev[0]+=1 
+                    if nfev[0]>solver['maxfev'] : 
+                        raise RuntimeError("More than maxfev="+str(solver['maxfev'])+ 
+                                           " evaluations of the right-hand side.") 
+                    return fun(t+s,u,model) 
+                try : 
+                    sol=integrate.solve_ivp(segfun,(0.0,timei-t),restart(u), 
+                                            method=method,args=(model,), 
+                                            rtol=solver['rtol'],atol=solver['atol'], 
+                                            jac=None if jac is None else lambda s,u,model : jac(t+s,u,model), 
+                                            first_step=None if step is None else min(step,timei-t)) 
+                    message=sol.message 
+                except RuntimeError as error : 
+                    sol,message=None,str(error) 
+                success=sol is not None and bool(sol.success) 
+                log_event(conf,'segment',backend='Python',method=method,t0=t,t1=timei,
+                          wall=time.perf_counter()-wall,steps=None if sol is None else sol.t.shape[0]-1, 
+                          nfev=nfev[0],njev=None if sol is None else sol.njev, 
+                          nlu=None if sol is None else sol.nlu,success=success,message=message) 
+                if success : 
+                    break 
+            if not success : 
+                print("Integration failed:",message) 
+                exit() 
+            u=sol.y[:,-1] 
+            if sol.t.shape[0]>1 : 
+                step=sol.t[-1]-sol.t[-2] 
+        t=timei 
+        y.append(state(t,u)) 
+        if segment is not None : 
+            segment(t,y[-1],u,step) 
+    y=np.column_stack(y) if y else np.zeros((model['dyn'].shape[0],0)) 
+    if solver['jacobianoutput']!='' and times.shape[0]>0 : 
+        write_jacobian(solver['jacobianoutput'],times[-1],y[:,-1],model) 
+    time1=[timei for timei in time1 if float(timei) in times] 
+    return time1, y[:,np.searchsorted(times,np.array(time1,dtype=float))] 
+     
+     
+def write_results(conf,model,ltp,time1,y) : 
+    """Writes the same columns as the fprintf of the Maple input generated by printtxt: 
+    pressures/concentrations, surface concentrations and reaction rates. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        ltp: List-to-print dictionary of lists. 
+        time1: List of times, one row per time. 
+        y: Concentrations of the species with differential equations, one column per time. 
+    """
+    header,rows=results_table(conf,model,ltp,time1,y) 
+    with open(get_outputfile(conf),'w') as out : 
+        out.write(', '.join(header)+"\n") 
+        for row in rows : 
+            out.write(', '.join(row)+"\n") 
+    if get_binaryoutput(conf) : 
+        write_columns(get_binaryoutput(conf),header,rows) 
+     
+     
+def results_table(conf,model,ltp,time1,y) : 
+    """Header and rows (lists of strings) written by write_results. See write_results. 
+    """
+    header=(['catalyst', '"timei"', '"T"']+
+            ['"'+item+'"' for item in ltp['prs']]+
+            ['"'+item[2:]+'"' for item in ltp['itm']]+
+            ['"'+item[2:]+'"' for item in ltp['rxn']]) 
+    rows=[] 
+    module=sys.modules[model['rhsmodule'][1]] if 'rhsmodule' in model else None 
+    for k,timei in enumerate(time1) : 
+        if module is None : 
+            r=rates(model,float(timei),y[:,k]) 
+        else : 
+            r=module.rates(float(timei),y[:,k]) 
+        if model.get('fast') is not None and model['fast'].shape[0]>0 : 
+            r[model['fast']]=quasi_equilibrium_rates(model,float(timei),y[:,k]) 
+        prs,T=model['prs'],conf.get("Reactor","reactortemp") 
+        if 'program' in model : 
+            # Temperature and feeds at timei, as printed by the Maple input. 
+            prs=programmed_feeds(model,float(timei))[model['phase']!=0] 
+            T=repr(programmed_temperature(model,float(timei))) 
+        row=np.concatenate((prs,[1.0-y[:,k].sum()],y[:,k],r))
+        rows.append([conf['Catalyst']['name'],repr(float(timei)),T]+
+                    ["{:.16E}".format(value) for value in row])
+    return header, rows 
+     
+     
+def write_columns(filename,header,rows) : 
+    """Writes a results table in a columnar binary format: an uncompressed .npz with the numeric 
+    columns as a single Fortran-ordered array, so that each column is contiguous and can be 
+    memory-mapped alone (see read_columns). 
+    Members: columns (names), data (rows x columns), labels and text (non-numeric columns, 
+    such as the catalyst, as strings). 
+     
+    Args: 
+        filename: Output file, usually with extension .npz. 
+        header: Column names, quoted or not. 
+        rows: Lists of strings; empty values are NaN. 
+    """
+    names=[name.strip().strip('"') for name in header] 
+    columns,data,labels,text=[],[],[],[] 
+    for k,name in enumerate(names) : 
+        values=[row[k].strip().strip('"') if k<len(row) else '' for row in rows] 
+        try : 
+            data.append([float(value) if value else np.nan for value in values]) 
+            columns.append(name) 
+        except ValueError : 
+            labels.append(name) 
+            text.append(values) 
+    data=np.asfortranarray(np.array(data,dtype=float).reshape(len(columns),len(rows)).T) 
+    text=np.array(text,dtype=str).reshape(len(labels),len(rows)).T 
+    with open(filename,'wb') as f :  # np.savez appends .npz to names without it. 
+        np.savez(f,columns=np.array(columns,dtype=str),data=data, 
+                 labels=np.array(labels,dtype=str),text=text) 
+     
+     
+def read_columns(filename,columns=None) : 
+    """Reads columns of a file written by write_columns. Numeric columns are memory-mapped 
+    views of the file: only the requested ones are read from disk. 
+     
+    Args: 
+        filename: File written by write_columns. 
+        columns: Names or shell-style patterns, e.g. ['timei', 'CSL*', 'i1*']. All by default. 
+     
+    Returns: 
+        results: Dict of 1D arrays by column name, in the order of the file. 
+    """
+    import zipfile, fnmatch 
+    with np.load(filename) as npz : 
+        names=list(npz['columns']) 
+        labels=list(npz['labels']) 
+        text=npz['text'] 
+    selected=lambda name : columns is None or any(fnmatch.fnmatchcase(name,pattern) for pattern in columns) 
+    results={} 
+    for k,name in enumerate(labels) : 
+        if selected(name) : 
+            results[name]=text[:,k] 
+    if not any(selected(name) for name in names) : 
+        return results 
+     
+    # Offset of the data member, an uncompressed .npy inside the zip file. 
+    with zipfile.ZipFile(filename) as z : 
+        info=z.getinfo('data.npy') 
+    with open(filename,'rb') as f : 
+        f.seek(info.header_offset+26) 
+        f.seek(info.header_offset+30+sum(np.frombuffer(f.read(4),dtype='<u2'))) 
+        version=np.lib.format.read_magic(f) 
+        if version==(1,0) : 
+            shape,fortran,dtype=np.lib.format.read_array_header_1_0(f) 
+        else : 
+            shape,fortran,dtype=np.lib.format.read_array_header_2_0(f) 
+        offset=f.tell() 
+    if info.compress_type!=zipfile.ZIP_STORED or 0 in shape : 
+        with np.load(filename) as npz : 
+            data=npz['data'] 
+    else : 
+        data=np.memmap(filename,dtype=dtype,mode='r',offset=offset,shape=shape, 
+                       order='F' if fortran else 'C') 
+    for k,name in enumerate(names) : 
+        if selected(name) : 
+            results[name]=data[:,k] 
+    return results 
+     
+     
+def convert_results(filename,output=None) : 
+    """Converts a text output (mapleoutput of Maple, or of the in-process backends): 
+    comma-separated values with a header, into the format of write_columns. 
+    Blank rows are skipped. 
+     
+    Args: 
+        filename: Text output. 
+        output: Binary file. The text file with extension .npz by default. 
+     
+    Returns: 
+        output: Name of the binary file. 
+    """
+    if output is None : 
+        output=os.path.splitext(filename)[0]+'.npz' 
+    with open(filename) as f : 
+        header=f.readline().split(',') 
+        rows=[line.rstrip('\n').split(',') for line in f] 
+    rows=[row for row in rows if any(value.strip() for value in row)] 
+    write_columns(output,header,rows) 
+    return output 
+     
+     
+def is_steady(model,y,rtol,atol,tmax) : 
+    """True if the net rate of formation of every species is negligible compared with the 
+    gross rates at which it is formed and consumed, and would change its concentration 
+    less than atol within tmax: |dc/dt| <= rtol*gross+atol/tmax. 
+    """
+    rd,ri=fluxes(model,np.inf,y) 
+    gross=abs(model['stoich']).dot(rd+ri) 
+    return np.all(np.abs(model['stoich'].dot(rd-ri))<=rtol*gross+atol/tmax) 
+     
+     
+def is_singular(model,y) : 
+    """True if the Jacobian at steady-state conditions is singular to working precision at y, 
+    e.g. when groups of intermediates only exchange among themselves: steady states are then 
+    not isolated, and the one reached depends on the initial state. 
+    """
+    from scipy.sparse import linalg 
+      
+    try : 
+        diagonal=np.abs(linalg.splu(jacobian(np.inf,y,model).tocsc()).U.diagonal()) 
+    except RuntimeError :  # Exactly singular 
+        return True 
+    return diagonal.min()<=y.shape[0]*np.finfo(float).eps*diagonal.max() 
+     
+     
+def newton(model,y,rtol,atol,tmax,maxiter=100,strict=False) : 
+    """Damped Newton method on the site-balanced SODE at steady state, dc/dt=0.  
+    Steps are halved until the residual decreases; concentrations are kept non-negative. 
+     
+    Args: 
+        model: Model from compile_network. 
+        y: Initial guess of the concentrations. 
+        rtol, atol: Tolerances on the full Newton step. 
+        tmax: Time scale of the tolerances of is_steady. 
+        maxiter: Maximum number of iterations. 
+        strict: Converge only on the step, never on is_steady, which accepts slow drifts of 
+            species in fast equilibria: needed from warm starts that are almost steady. 
+     
+    Returns: 
+        y: Last concentrations. 
+        converged: True if steady (see is_steady) or if the step fell below the tolerances. 
+    """
+    from scipy.sparse import linalg 
+      
+    t=np.inf # Steady state, pressures fully damped. 
+    f=rhs(t,y,model) 
+    for iteration in range(maxiter) : 
+        if not strict and is_steady(model,y,rtol,atol,tmax) : 
+            return y, True 
+        with warnings.catch_warnings() : 
+            warnings.simplefilter('ignore',linalg.MatrixRankWarning)  # Singular: returns nan 
+            dy=linalg.spsolve(jacobian(t,y,model).tocsc(),-f) 
+        if not np.all(np.isfinite(dy)) : 
+            return y, False 
+        # Converged if the full Newton step is below tolerances. 
+        # The residual may not decrease further because of round-off in the site balance. 
+        if np.all(np.abs(dy)<=atol+rtol*np.abs(y)) : 
+            return np.maximum(y+dy,0.0), True 
+        norm=np.linalg.norm(f) 
+        lam=1.0 
+        while lam>1E-10 : 
+            ynew=np.maximum(y+lam*dy,0.0) 
+            fnew=rhs(t,ynew,model) 
+            if np.linalg.norm(fnew)<=(1.0-1E-4*lam)*norm or norm==0.0 : 
+                break 
+            lam*=0.5 
+        else : 
+            return y, False 
+        y,f=ynew,fnew 
+    return y, False 
+     
+     
+def pseudo_transient(model,y,rtol,atol,tmax,dt=1E-15,maxsteps=10000) : 
+    """Short pseudo-transient integration of the SODE at steady-state conditions: 
+    linearized implicit-Euler steps, (I/dt-J)*dy=f. Unlike Newton, the matrix is never singular, 
+    even if groups of intermediates are disconnected from the feed. 
+    The time step grows up to x10 while coverages change less than 0.05 per step; steps 
+    changing a coverage by more than 0.5 are rejected. Concentrations are projected onto 
+    c>=0, sum(c)<=1. Newton is attempted every time the time step grows x1000. 
+     
+    Args: 
+        model: Model from compile_network. 
+        y: Initial concentrations. 
+        rtol, atol: Tolerances. 
+        tmax: Time scale of the tolerances of is_steady. 
+        dt: Initial time step. 
+        maxsteps: Maximum number of steps, including rejected ones. 
+     
+    Returns: 
+        y: Last concentrations. 
+        converged: True if steady (see is_steady) or Newton converged. 
+    """
+    from scipy import sparse 
+    from scipy.sparse import linalg 
+      
+    t=np.inf # Steady state, pressures fully damped. 
+    eye=sparse.identity(y.shape[0],format='csr') 
+    f=rhs(t,y,model) 
+    dtnewton=dt*1E3 
+    for step in range(maxsteps) : 
+        with warnings.catch_warnings() : 
+            warnings.simplefilter('ignore',linalg.MatrixRankWarning)  # Singular: returns nan 
+            try : 
+                dy=linalg.spsolve((eye/dt-jacobian(t,y,model)).tocsc(),f) 
+            except RuntimeError :  # Failed factorization, treated as a rejected step 
+                dy=np.full(y.shape,np.nan) 
+        change=np.abs(dy).max() 
+        if not np.isfinite(change) or change>0.5 : 
+            dt*=0.1  # Reject the step 
+            continue 
+        y=np.maximum(y+dy,0.0) 
+        y/=max(1.0,y.sum()) 
+        f=rhs(t,y,model) 
+        if is_steady(model,y,rtol,atol,tmax) : 
+            return y, True 
+        dt*=min(10.0,max(0.5,0.05/max(change,1E-300))) 
+        if dt>1E100 :  # Plain Newton steps by now, nothing left to gain 
+            break 
+        if dt>=dtnewton : 
+            ynewton,converged=newton(model,y,rtol,atol,tmax) 
+            if converged : 
+                return ynewton, True 
+            dtnewton=dt*1E3 
+    return y, False 
+     
+     
+def solve_steady(conf,model,ltp) : 
+    """Solves the steady state (reactortype=SteadyState) by damped Newton from the clean surface. 
+    If Newton fails, falls back to a pseudo-transient integration. The state is steady if no 
+    concentration would change more than the absolute tolerance within the last time1. 
+    Where the Jacobian is singular, the steady states are not isolated and the one reached 
+    by the time course up to the last time1 is taken instead, with a warning. 
+    Writes the same columns as solve_sode, in a single row with timei=inf. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+        ltp: List-to-print dictionary of lists. 
+    """
+    write_results(conf,model,ltp,[np.inf],steady_state(conf,model)[:,None]) 
+     
+     
+def steady_state(conf,model) : 
+    """Steady-state concentrations of the species with differential equations. 
+    See solve_steady. 
+    """
+    if 'program' in model : 
+        print("No steady state in programmed reactors: temperature and feeds change with time.") 
+        exit() 
+    solver=get_solver(conf) 
+    time1,timel=rxntime(conf) 
+    if not timel : 
+        time1=[float(time1)] 
+    tmax=max(np.array(time1,dtype=float)) 
+    y0=np.zeros(model['dyn'].shape[0]) 
+    y,converged=newton(model,y0,solver['rtol'],solver['atol'],tmax) 
+    if not converged : 
+        y,converged=pseudo_transient(model,y0,solver['rtol'],solver['atol'],tmax) 
+    if not converged : 
+        print("Steady state not found") 
+        exit() 
+    # Not isolated: the steady state of the time course from the clean surface, at the last time1. 
+    if is_singular(model,y) : 
+        print("WARNING! The Jacobian at the steady state is singular, the steady state is not unique.", 
+              "\n Taking the one reached by integrating from the clean surface up to",tmax) 
+        time1,y=integrate_sode(conf,model) 
+        y=y[:,np.argmax(np.array(time1,dtype=float))] 
+    return y
+     
+     
+def get_sweep(conf) : 
+    """Parse the [Sweep] section of the configuration file. Each option is a grid of values 
+    (a list, or a single value) for an option of another section: either "section.option", 
+    e.g. Pressures.gR=[0.1,1.0], or just the option for those in "sweepsections", 
+    e.g. reactortemp=[300,350,400]. The option "processes" sets the size of the process pool. 
+     
+    Args: 
+        conf: Configuration data. 
+     
+    Returns: 
+        grid: List of (key, section, option, list of values). 
+        processes: Number of worker processes (all cores by default). 
+    """
+    grid=[] 
+    processes=os.cpu_count() 
+    for key in conf['Sweep'] : 
+        if key=='processes' : 
+            processes=int(conf['Sweep'][key]) 
+            continue 
+        if key.find('.')>0 : 
+            section,option=key.split('.',1) 
+            section=[name for name in conf.sections() if name.lower()==section.lower()]+[section.capitalize()] 
+            section=section[0] 
+        elif key in sweepsections : 
+            section,option=sweepsections[key],key 
+        else : 
+            print("Unknown option in [Sweep]:",key,"\n Use section.option, or one of",list(sweepsections)) 
+            exit() 
+        values=ast.literal_eval(conf['Sweep'][key]) 
+        if not isinstance(values,(list,tuple)) : 
+            values=[values] 
+        grid.append((key,section,option,list(values))) 
+    return grid, processes 
+     
+     
+def sweep_init(confdict) : 
+    """Initializer of the worker processes of sweep: keeps the configuration, shared by all 
+    the conditions run by the worker. 
+    """
+    sweepdata['conf']=confdict 
+     
+     
+def sweep_point(condition) : 
+    """Solves the network for one condition of the sweep, in a worker process: 
+    same steps as amk.py, with the network of load_network (cached per condition). 
+     
+    Args: 
+        condition: List of (section, option, value). 
+     
+    Returns: 
+        header, rows: Results as in results_table; None if the condition failed. 
+    """
+    conf=configparser.ConfigParser(inline_comment_prefixes=('#')) 
+    conf.read_dict(sweepdata['conf']) 
+    for section,option,value in condition : 
+        if not conf.has_section(section) : 
+            conf.add_section(section) 
+        conf[section][option]=str(value) 
+    try : 
+        itm,rxn,ltp,model,sbalance,sodesolv,initialc,rhsparse=load_network(conf) 
+        model=compile_network(conf,model) 
+        if get_reactortype(conf)=='SteadyState' : 
+            time1,y=[np.inf],steady_state(conf,model)[:,None] 
+        else : 
+            time1,y=integrate_sode(conf,model) 
+    except SystemExit : 
+        return None 
+    return results_table(conf,model,ltp,time1,y) 
+     
+     
+def sweep(conf) : 
+    """Runs the network on every combination of the grids of the [Sweep] section in a pool 
+    of processes, with the in-process solver (Differential, SteadyState or Programmed reactor). 
+    Each condition is processed as a single run, see load_network, so that [Reduction] and 
+    [Cache] apply to every condition. Writes a single table in the output file: the swept 
+    values followed by the same columns as write_results. 
+     
+    Args: 
+        conf: Configuration data. 
+    """
+    import itertools 
+    from concurrent import futures 
+      
+    grid,processes=get_sweep(conf) 
+    keys=[key for key,section,option,values in grid] 
+    conditions=[[(section,option,value) for (key,section,option,values),value in zip(grid,point)] 
+                for point in itertools.product(*[values for key,section,option,values in grid])] 
+    confdict={section:dict(conf[section]) for section in conf.sections()} 
+    with futures.ProcessPoolExecutor(max_workers=processes,initializer=sweep_init,
+                                     initargs=(confdict,)) as pool : 
+        results=list(pool.map(sweep_point,conditions)) 
+      
+    # Table keyed by condition 
+    with open(get_outputfile(conf),'w') as out : 
+        header=[result[0] for result in results if result is not None] 
+        if header : 
+            out.write(', '.join(['"'+key+'"' for key in keys]+header[0])+"\n") 
+        for condition,result in zip(conditions,results) : 
+            values=[str(value) for section,option,value in condition] 
+            if result is None : 
+                print("Failed condition:",', '.join([key+"="+value for key,value in zip(keys,values)])) 
+                continue 
+            for row in result[1] : 
+                out.write(', '.join(values+row)+"\n") 
+     
+     
+def get_continuation(conf) : 
+    """Parse the [Continuation] section of the configuration file: the option walked 
+    (parameter: electricpotentialrhe, pH, or reactortemp), its grid (values, walked in 
+    order), the largest change of any concentration between consecutive points before 
+    a midpoint is inserted (maxchange, 0.05 by default), and the smallest step of the 
+    parameter (minstep, 1/64 of the smallest step of the grid by default). 
+     
+    Returns: 
+        continuation: Dict with section, option, values, maxchange, and minstep. 
+    """
+    cont=conf['Continuation'] 
+    option=cont.get('parameter','electricpotentialrhe').replace('"','').replace("'","").strip().lower() 
+    if option not in sweepsections : 
+        print("Unknown parameter in [Continuation]:",option,"\n Use one of",list(sweepsections)) 
+        exit() 
+    try : 
+        values=[float(value) for value in ast.literal_eval(cont['values'])] 
+    except : 
+        print("[Continuation] needs a list of values, e.g. values=[-0.6, -0.5, -0.4]") 
+        exit() 
+    if sweepsections[option]=='Electrochemistry' and not (conf.has_option('Electrochemistry','electricpotentialrhe') 
+                                                       and conf.has_option('Electrochemistry','pH')) : 
+        print("[Continuation] of",option,"needs electricpotentialrhe and pH in [Electrochemistry]") 
+        exit() 
+    steps=np.abs(np.diff(values)) 
+    steps=steps[steps>0] 
+    continuation={'section':sweepsections[option], 'option':option, 'values':values, 
+                  'maxchange':float(cont.get('maxchange','0.05')), 
+                  'minstep':float(cont.get('minstep',str(steps.min()/64 if steps.shape[0] else 0.0)))} 
+    return continuation 
+     
+     
+def continuation(conf) : 
+    """Walks the grid of the [Continuation] section in order, solving the steady state at 
+    each point from the converged state of the previous one (damped Newton converged on the 
+    step; if it fails, integration up to the longest time of time1), instead of generating 
+    and solving each point from the clean surface. The network is processed once, at the first 
+    point, as a single run (see load_network); the potential, pH or temperature only enter 
+    through rate_constants, the vectorized counterpart of adjust_energy_with_potential. 
+    Where a step changes some concentration by more than maxchange, or fails, midpoints are 
+    inserted down to minstep. Writes a single table in the output file: the parameter 
+    followed by the same columns as write_results, one row per point, refinements included. 
+     
+    Args: 
+        conf: Configuration data. (Mutable, the parameter is left at its last value)
+    """
+    from scipy import integrate 
+      
+    cont=get_continuation(conf) 
+    section,option=cont['section'],cont['option'] 
+    if not conf.has_section(section) : 
+        conf.add_section(section) 
+      
+    # Network processed once, at the first point. 
+    conf[section][option]=repr(cont['values'][0]) 
+    itm,rxn,ltp,model,sbalance,sodesolv,initialc,rhsparse=load_network(conf) 
+    log_event(conf,'network',**network_size(model)) 
+    model=compile_network(conf,model) 
+    solver=get_solver(conf) 
+    time1,timel=rxntime(conf) 
+    tmax=max(np.array(time1 if timel else [time1],dtype=float)) 
+      
+    def solve(value,y0) : 
+        """Steady state at value of the parameter from y0; None if not found.""" 
+        conf[section][option]=repr(value) 
+        model['T']=float(conf['Reactor']['reactortemp']) 
+        model['kd'],model['ki']=rate_constants(conf,model,model['T'],get_elecpot(conf)) 
+        y,converged=newton(model,y0,solver['rtol'],solver['atol'],tmax,strict=True) 
+        if converged : 
+            return y 
+        # Singular Jacobian (groups not connected to the feeds) or far from the new state: 
+        # integrate up to the longest time, as the Differential reactor would. 
+        sol=integrate.solve_ivp(lambda t,y,model : rhs(np.inf,y,model),(0.0,tmax),y0, 
+                                method=solver['method'],args=(model,),rtol=solver['rtol'], 
+                                atol=solver['atol'],jac=lambda t,y,model : jacobian(np.inf,y,model)) 
+        return sol.y[:,-1] if sol.success else None 
+      
+    header=None 
+    rows=[] 
+    pending=list(cont['values']) 
+    previous,y=None,np.zeros(model['dyn'].shape[0]) 
+    while pending : 
+        value=pending[0] 
+        ynew=solve(value,y) 
+        if (previous is not None and abs(value-previous)>cont['minstep']*(1+1E-9) and 
+            (ynew is None or np.abs(ynew-y).max()>cont['maxchange'])) : 
+            pending.insert(0,0.5*(previous+value)) # Refine 
+            continue 
+        pending.pop(0) 
+        if ynew is None : 
+            print("Failed condition:",option+"="+repr(value)) 
+            continue 
+        header,row=results_table(conf,model,ltp,[np.inf],ynew[:,None]) 
+        rows.append([repr(value)]+row[0]) 
+        log_event(conf,'continuation',parameter=option,value=value,refined=value not in cont['values']) 
+        previous,y=value,ynew 
+      
+    with open(get_outputfile(conf),'w') as out : 
+        if header : 
+            out.write(', '.join(['"'+option+'"']+header)+"\n") 
+        for row in rows : 
+            out.write(', '.join(row)+"\n") 
+     
+     
+def get_ratecontrol(conf) : 
+    """Parse the [RateControl] section of the configuration file. 
+     
+    Returns: 
+        control: Dict with the output rates (labels of reactions, with or without the "sr" of 
+            the Maple output; by default those exchanging species with the gas/aqueous phase), 
+            intermediates (True to also get the thermodynamic rate control), the method 
+            ('Sensitivity' or 'FiniteDifference'), the energy step of the finite differences 
+            in eV, the size of the process pool, and the output file. 
+    """
+    control={'rates':None, 'intermediates':False, 'method':'Sensitivity', 'step':1E-3, 
+             'processes':os.cpu_count(), 'output':'ratecontrol.xls'} 
+    for key in conf['RateControl'] : 
+        if key not in control : 
+            print("Unknown option in [RateControl]:",key,"\n I only recognize",list(control)) 
+            exit() 
+        if key=='rates' : 
+            control[key]=ast.literal_eval(conf['RateControl'][key]) 
+        elif key=='intermediates' : 
+            control[key]=conf.getboolean('RateControl',key) 
+        else : 
+            control[key]=conf['RateControl'][key].replace('"','').replace("'","").strip() 
+    if control['method'] not in ['Sensitivity','FiniteDifference'] : 
+        print("Unknown method in [RateControl]:",control['method'], 
+              "\n I only recognize Sensitivity and FiniteDifference") 
+        exit() 
+    control['step']=float(control['step']) 
+    control['processes']=int(control['processes']) 
+    return control 
+     
+     
+def energy_derivatives(model,intermediates=False) : 
+    """Derivatives of the activation energies of the kinetic constants, max(0,aG,dG) as in 
+    rate_constants, with respect to the energies of the transition states (one column per 
+    reaction) and, if intermediates, of the intermediates (one more column per intermediate). 
+    Where branches of the max tie, e.g. barrierless steps with aG=0, they share the 
+    derivative, as central differences do. 
+     
+    Returns: 
+        Ed, Ei: Sparse matrices (nrxn, nparameters) for the direct and reverse constants; 
+            dln(k)/dG=-E/(kB*T). 
+    """
+    from scipy import sparse 
+      
+    nrxn=len(model['rxn']) 
+    npar=nrxn+len(model['itm'])*intermediates 
+    w=model['state'].shape[1]//2 
+    E=[] 
+    for aG,dG,initial,final in [(model['aGd'], model['dGd'],range(w),range(w,2*w)), 
+                                (model['aGi'],-model['dGd'],range(w,2*w),range(w))] : 
+        # Weights of the branches 0, aG (=GTS-Ginitial) and dG (=Gfinal-Ginitial) 
+        branches=np.column_stack((np.zeros(nrxn),aG,dG)) 
+        weight=branches>=branches.max(axis=1)[:,None]-1E-9 
+        weight=weight/weight.sum(axis=1)[:,None] 
+        rows,cols,vals=[np.arange(nrxn)],[np.arange(nrxn)],[weight[:,1]] 
+        if intermediates : 
+            for k,value in [(k,-weight[:,1]-weight[:,2]) for k in initial]+[(k,weight[:,2]) for k in final] : 
+                j=np.nonzero(model['state'][:,k]>=0)[0] 
+                rows.append(j) 
+                cols.append(nrxn+model['state'][j,k]) 
+                vals.append(value[j]) 
+        E.append(sparse.csr_matrix((np.concatenate(vals),(np.concatenate(rows),np.concatenate(cols))), 
+                                   shape=(nrxn,npar))) 
+    return E[0], E[1] 
+     
+     
+def perturbed_model(conf,model,p,delta) : 
+    """Model with the energy of parameter p (see energy_derivatives) shifted by delta: 
+    energies, kinetic constants and, with lateral interactions, the energies at zero 
+    coverage from which effective_constants corrects them. 
+    """
+    nrxn=len(model['rxn']) 
+    dGd,aGd,aGi=model['dGd'].copy(),model['aGd'].copy(),model['aGi'].copy() 
+    if p<nrxn : 
+        aGd[p]+=delta 
+        aGi[p]+=delta 
+    else : 
+        w=model['state'].shape[1]//2 
+        for k in range(2*w) : 
+            j=model['state'][:,k]==p-nrxn 
+            if k<w : 
+                dGd[j]-=delta 
+                aGd[j]-=delta 
+            else : 
+                dGd[j]+=delta 
+                aGi[j]-=delta 
+    perturbed=dict(model,dGd=dGd,aGd=aGd,aGi=aGi) 
+    perturbed['kd'],perturbed['ki']=rate_constants(conf,perturbed,model['T']) 
+    if 'latmat' in model : 
+        perturbed['lat0']=np.concatenate((dGd,aGd,aGi)) 
+        perturbed['ea0']=np.maximum(0.0,np.maximum(aGd,dGd)),np.maximum(0.0,np.maximum(aGi,-dGd)) 
+    return perturbed 
+     
+     
+def ratecontrol_init(confdict,model,outs,y,tmax) : 
+    """Initializer of the worker processes of rate_control: keeps the network and its 
+    steady state, the warm start of every perturbed solve. 
+    """
+    ratecontroldata['conf']=configparser.ConfigParser(inline_comment_prefixes=('#')) 
+    ratecontroldata['conf'].read_dict(confdict) 
+    ratecontroldata['model']=model 
+    ratecontroldata['outs']=outs 
+    ratecontroldata['y']=y 
+    ratecontroldata['tmax']=tmax 
+     
+     
+def ratecontrol_batch(batch) : 
+    """Steady-state output rates of a batch of perturbed networks, in a worker process. 
+     
+    Args: 
+        batch: List of (parameter, energy shift in eV); see perturbed_model. 
+     
+    Returns: 
+        rates: Array (len(batch), noutputs) of the output rates; nan if not steady. 
+    """
+    conf=ratecontroldata['conf'] 
+    model=ratecontroldata['model'] 
+    y0=ratecontroldata['y'] 
+    solver=get_solver(conf) 
+    out=np.full((len(batch),len(ratecontroldata['outs'])),np.nan) 
+    for b,(p,delta) in enumerate(batch) : 
+        perturbed=perturbed_model(conf,model,p,delta) 
+        y,converged=newton(perturbed,y0,solver['rtol'],solver['atol'],ratecontroldata['tmax']) 
+        if not converged : 
+            y,converged=pseudo_transient(perturbed,y0,solver['rtol'],solver['atol'], 
+                                         ratecontroldata['tmax']) 
+        if converged : 
+            out[b]=rates(perturbed,np.inf,y)[ratecontroldata['outs']] 
+    return out 
+     
+     
+def rate_control(conf,model) : 
+    """Degrees of rate control of the output rates of [RateControl] at the steady state 
+    (see steady_state), X=-kB*T*dln(r)/dG, with respect to the energy of every transition 
+    state and, optionally, of every intermediate (thermodynamic rate control). 
+    The other energies are kept fixed, so X sums to one over the transition states of a 
+    single route. 
+     
+    Two methods: 
+        Sensitivity: linear response of the steady state, dr/dG=pr/pG-pr/pc*inv(J)*S*pr/pG 
+            (p for partial derivatives at fixed concentrations or energies), with a single 
+            sparse factorization of the Jacobian J for all the energies: one back-substitution 
+            per output rate. Falls back to FiniteDifference if J is singular, e.g. if groups of 
+            intermediates are disconnected from the feed. 
+        FiniteDifference: central differences, each perturbed network solved with Newton 
+            from the unperturbed steady state, in batches over a pool of processes. 
+     
+    Writes one row per energy: label, type (TS/itm) and X for each output rate. 
+     
+    Args: 
+        conf: Configuration data. 
+        model: Model from compile_network. 
+    """
+    from scipy.sparse import linalg 
+      
+    control=get_ratecontrol(conf) 
+    nrxn=len(model['rxn']) 
+    # Output rates 
+    labels=control['rates'] 
+    if labels is None : 
+        labels=[item for j,item in enumerate(model['rxn']) if model['damped'][j].any()] 
+    index={item:j for j,item in enumerate(model['rxn'])} 
+    outs=[] 
+    for label in labels : 
+        if label not in index and label[:2]=='sr' and label[2:] in index : 
+            label=label[2:] 
+        if label not in index : 
+            print("Unknown reaction in [RateControl] rates:",label) 
+            exit() 
+        outs.append(index[label]) 
+     
+    # Unperturbed steady state 
+    time1,timel=rxntime(conf) 
+    if not timel : 
+        time1=[float(time1)] 
+    tmax=max(np.array(time1,dtype=float)) 
+    y=steady_state(conf,model) 
+    r=rates(model,np.inf,y)[outs] 
+    kbt=float(kbev)*model['T'] 
+    branches=model 
+    if 'latmat' in model : 
+        # Branches of the activation energies at the coverages of the steady state, see lateral_energies. 
+        dGd,aGd,aGi=np.split(model['lat0']+model['latmat'].dot(extended_state(y)[:-1]),3) 
+        branches=dict(model,dGd=dGd,aGd=aGd,aGi=aGi) 
+    Ed,Ei=energy_derivatives(branches,control['intermediates']) 
+    npar=Ed.shape[1] 
+     
+    X=None 
+    if control['method']=='Sensitivity' : 
+        rd,ri=fluxes(model,np.inf,y) 
+        # Derivatives of the rates with respect to the energies at fixed concentrations 
+        drdG=(Ed.multiply(-rd[:,None])+Ei.multiply(ri[:,None])).tocsr()/kbt 
+        try : 
+            # Adjoint of the output rates: pr/pc*inv(J) 
+            lu=linalg.splu(jacobian(np.inf,y,model).T.tocsc()) 
+            lam=lu.solve(rate_derivatives(model,np.inf,y,outs).T) 
+            if not np.all(np.isfinite(lam)) : 
+                raise RuntimeError 
+            dr=drdG[outs].toarray()-(model['stoich'].dot(drdG)).T.dot(lam).T 
+            with np.errstate(divide='ignore',invalid='ignore') : # nan/inf for rates at zero 
+                X=-kbt*dr/r[:,None] 
+        except RuntimeError : 
+            print("Singular Jacobian at the steady state: using finite differences") 
+    if X is None : 
+        from concurrent import futures 
+        batch=[(p,sign*control['step']) for p in range(npar) for sign in [1.0,-1.0]] 
+        size=int(np.ceil(len(batch)/(4*control['processes']))) # Four batches per process 
+        batches=[batch[i:i+size] for i in range(0,len(batch),size)] 
+        confdict={section:dict(conf[section]) for section in conf.sections()} 
+        with futures.ProcessPoolExecutor(max_workers=control['processes'],initializer=ratecontrol_init,
+                                         initargs=(confdict,model,outs,y,tmax)) as pool : 
+            rp=np.vstack(list(pool.map(ratecontrol_batch,batches))) 
+        with np.errstate(divide='ignore',invalid='ignore') : 
+            X=(-kbt*(rp[0::2]-rp[1::2])/(2*control['step'])/r).T 
+      
+    names=model['rxn']+(model['itm'] if control['intermediates'] else []) 
+    with open(control['output'],'w') as out : 
+        out.write(', '.join(['"parameter"','"type"']+['"Xsr'+model['rxn'][j]+'"' for j in outs])+"\n") 
+        for p,name in enumerate(names) : 
+            out.write(', '.join(['"'+name+'"','"TS"' if p<nrxn else '"itm"']+ 
+                                ["{:.16E}".format(value) for value in X[:,p]])+"\n") 
+     
+     
+def load_network(conf,filenames=inputfiles) : 
+    """Processed network of the input files under conf: from the cache if enabled and the 
+    inputs are unchanged (see cache_load), else read, reduced (see reduce_network), and 
+    processed, incrementally if possible (see update_network), and then cached. 
+    The numbers of electrons of the transition states are taken from alpha whenever there is 
+    an [Electrochemistry] section, so that the potential can be changed in rate_constants. 
+     
+    Args: 
+        conf: Configuration data. 
+        filenames: Files of intermediates and reactions. 
+     
+    Returns: 
+        network: Tuple itm, rxn, ltp, model, sbalance, sodesolv, initialc, rhsparse. 
+    """
+    key=cache_key(conf,filenames) 
+    network=cache_load(conf,key) 
+    if network is not None : 
+        return network 
+    messages=[] # Report of the reduction, printed again when the network comes from the cache. 
+    with timed(conf,'read') : 
+        itm=read(filenames[0]) 
+        rxn=read(filenames[1]) 
+    if conf.has_section('Reduction') : 
+        itm,rxn=reduce_network(conf,itm,rxn,messages) 
+    fingerprints=row_fingerprints(itm),row_fingerprints(rxn) 
+    network=update_network(conf,itm,rxn,fingerprints) 
+    if network is None : 
+        # Electrochemical part: adjust energies to the electric potential vs SHE. 
+        elecpot=get_elecpot(conf) 
+        if conf.has_section('Electrochemistry') : 
+            get_nelect_for_rxn(conf,itm,rxn) 
+        if elecpot !=0 : 
+            adjust_energy_with_potential(conf,itm,elecpot) 
+            adjust_energy_with_potential(conf,rxn,elecpot) 
+        ltp={} 
+        with timed(conf,'process_intermediates') : 
+            itm,sbalance,sodesolv,initialc,rhsparse=process_intermediates(conf,itm,ltp) 
+        with timed(conf,'compile_model') : 
+            model=compile_model(conf,itm,rxn) 
+        with timed(conf,'process_rxn') : 
+            itm,rxn=process_rxn(conf,itm,rxn,ltp,model) 
+        network=itm,rxn,ltp,model,sbalance,sodesolv,initialc,rhsparse 
+    cache_store(conf,key,network,fingerprints,''.join(messages)) 
+    return network 
+     
+     
+def get_cache(conf) : 
+    """Parse the [Cache] section of the configuration file. Caching is enabled only if present. 
+     
+    Returns: 
+        cache: Dict with the directory of the cache and its maximum size in MB, or None. 
+    """
+    if not conf.has_section('Cache') : 
+        return None 
+    cache={'directory':'.amkcache', 'maxsize':100.0} 
+    for key in cache : 
+        if conf.has_option('Cache',key) : 
+            cache[key]=conf['Cache'][key].replace('"','').replace("'","").strip() 
+    cache['maxsize']=float(cache['maxsize']) 
+    return cache 
+     
+     
+def cache_key(conf,filenames) : 
+    """Content hash of the input files, the options of the configuration file that enter 
+    the processed network, and this library. Options that only affect solving or printing 
+    (noncachedoptions and the sections in noncachedsections) are left out. 
+     
+    Args: 
+        conf: Configuration data. 
+        filenames: Input files, normally itm.csv and rxn.csv. 
+     
+    Returns: 
+        key: Hexadecimal digest. 
+    """
+    import hashlib 
+    h=hashlib.sha256(conf_key(conf).encode()) 
+    for filename in filenames : 
+        with open(filename,'rb') as f : 
+            h.update(hashlib.sha256(f.read()).digest()) 
+    return h.hexdigest() 
+     
+     
+def conf_key(conf) : 
+    """Hash of the options that enter the processed network, and of this library. See cache_key. 
+    """
+    import hashlib 
+    h=hashlib.sha256() 
+    with open(__file__,'rb') as f : 
+        h.update(f.read()) 
+    for section in sorted(conf.sections()) : 
+        if section in noncachedsections : 
+            continue 
+        for option in sorted(conf[section]) : 
+            if (section,option) not in noncachedoptions : 
+                h.update(repr((section,option,conf[section][option])).encode()) 
+    # Differential and SteadyState share the network; programmed reactors do not (see get_program). 
+    h.update(repr(get_reactortype(conf)=='Programmed').encode()) 
+    return h.hexdigest() 
+     
+     
+def cache_load(conf,key) : 
+    """Processed network stored under key, see cache_store, or None if not cached. 
+    The report of the reduction stored with it is written again on the standard error. 
+    """
+    import pickle 
+    cache=get_cache(conf) 
+    if cache is None : 
+        return None 
+    filename=os.path.join(cache['directory'],key+'.pkl') 
+    try : 
+        with open(filename,'rb') as f : 
+            network,fingerprints,report=pickle.load(f) 
+    except (OSError,EOFError,pickle.UnpicklingError) : 
+        return None 
+    os.utime(filename) # Recently used entries are evicted last. 
+    sys.stderr.write(report) 
+    return network 
+     
+     
+def cache_store(conf,key,network,fingerprints=None,report='') : 
+    """Stores the processed network (tuple of dicts, strings and arrays) under key, 
+    with the row fingerprints of the inputs it comes from (see update_network) and the 
+    report of the reduction (see reduce_network), then evicts the oldest entries while the cache exceeds its maximum size. 
+    """
+    import pickle 
+    cache=get_cache(conf) 
+    if cache is None : 
+        return 
+    os.makedirs(cache['directory'],exist_ok=True) 
+    filename=os.path.join(cache['directory'],key+'.pkl') 
+    tmp='.'+str(os.getpid())+'.tmp' # Per process: the workers of sweep share the cache. 
+    with open(filename+tmp,'wb') as f : 
+        pickle.dump((network,fingerprints,report),f,protocol=pickle.HIGHEST_PROTOCOL) 
+    os.replace(filename+tmp,filename) 
+    # Last network generated with these options, the base of incremental updates. 
+    last=os.path.join(cache['directory'],conf_key(conf)+'.last') 
+    with open(last+tmp,'w') as f : 
+        f.write(key) 
+    os.replace(last+tmp,last) 
+      
+    entries=[] 
+    for entry in os.scandir(cache['directory']) : 
+        try : 
+            if entry.name.endswith('.pkl') : 
+                entries.append((entry.stat().st_mtime,entry.stat().st_size,entry.path)) 
+        except OSError : 
+            continue # Evicted by another process meanwhile. 
+    entries.sort() 
+    size=sum([entry[1] for entry in entries]) 
+    for mtime,entrysize,path in entries : 
+        if size<=cache['maxsize']*1E6 : 
+            break 
+        if path==filename : # Never evict the entry just stored. 
+            continue 
+        size-=entrysize 
+        try : 
+            os.remove(path) 
+        except OSError : 
+            pass
+     
+     
+def checkpoint_key(conf,filenames) : 
+    """Hash of everything that determines the time course: the inputs (filenames) and 
+    options of cache_key, the solver and the reactor type. Not time1, so that a finished run 
+    can be extended to longer times. 
+    """
+    import hashlib 
+    solver=get_solver(conf) 
+    solver.pop('jacobianoutput') 
+    h=hashlib.sha256(cache_key(conf,filenames).encode()) 
+    h.update(repr((sorted(solver.items()),get_reactortype(conf))).encode()) 
+    return h.hexdigest() 
+     
+     
+def checkpoint_load(filename,key) : 
+    """Checkpoint stored in filename (see checkpoint_store), or None if missing or from 
+    another configuration (different key). 
+    """
+    import pickle 
+    try : 
+        with open(filename,'rb') as f : 
+            checkpoint=pickle.load(f) 
+    except (OSError,EOFError,pickle.UnpicklingError) : 
+        return None 
+    if checkpoint.get('key')!=key : 
+        sys.stderr.write("Checkpoint "+filename+" comes from other inputs: starting over.\n") 
+        return None 
+    sys.stderr.write("Resuming from the checkpoint at t="+repr(checkpoint['t'])+".\n") 
+    return checkpoint 
+     
+     
+def checkpoint_store(filename,checkpoint) : 
+    """Stores the checkpoint, a dict with the key of checkpoint_key, the last time reached, 
+    the integrated state, the last step size, and the rows written so far. The file is 
+    replaced atomically, so a crash leaves the previous checkpoint. 
+    """
+    import pickle 
+    with open(filename+'.tmp','wb') as f : 
+        pickle.dump(checkpoint,f,protocol=pickle.HIGHEST_PROTOCOL) 
+    os.replace(filename+'.tmp',filename) 
+     
+     
+def row_fingerprints(dic) : 
+    """Digest of every row of a table read by read(), by label. 
+    """
+    import hashlib 
+    return {label:hashlib.blake2b(repr(sorted(record.items())).encode(),digest_size=16).digest() 
+            for label,record in dic.items()} 
+     
+     
+def update_network(conf,itm,rxn,fingerprints) : 
+    """Processes the network incrementally from the last one cached with the same options 
+    (see cache_store): only the reactions whose rows changed, were added, or involve an 
+    intermediate whose row changed are processed again, and only the differential equations 
+    of the intermediates in those or in removed reactions are rebuilt. The result is 
+    identical to processing the whole network. 
+    Not possible without cache, with Shared constants, or if intermediates were added, removed 
+    or changed phase, as the site balance and the SODE solver would change; nor with lateral 
+    interactions, [Vibrations] or programmed reactors, compiled for the whole network. 
+     
+    Args: 
+        conf: Configuration data. 
+        itm: Dict of dicts of intermediates, as read. 
+        rxn: Dict of dicts of reactions, as read. 
+        fingerprints: Row fingerprints of itm and rxn, see row_fingerprints. 
+     
+    Returns: 
+        network: Tuple itm, rxn, ltp, model, sbalance, sodesolv, initialc, rhsparse as 
+            processed by amk.py, or None if it has to be processed from scratch. 
+    """
+    import pickle 
+    cache=get_cache(conf) 
+    if cache is None or get_constantsmode(conf)=='Shared' : 
+        return None 
+    try : 
+        with open(os.path.join(cache['directory'],conf_key(conf)+'.last')) as f : 
+            filename=os.path.join(cache['directory'],f.read().strip()+'.pkl') 
+        with open(filename,'rb') as f : 
+            network,oldfingerprints,report=pickle.load(f) 
+    except (OSError,EOFError,pickle.UnpicklingError) : 
+        return None 
+    if oldfingerprints is None : 
+        return None 
+    olditm,oldrxn,ltp,oldmodel,sbalance,sodesolv,initialc,rhsparse=network 
+    if sorted(itm)!=oldmodel['itm'] : 
+        return None 
+    changeditm={item for item in itm if fingerprints[0][item]!=oldfingerprints[0][item]} 
+    if any([itm[item]['phase']!=olditm[item]['phase'] for item in changeditm]) : 
+        return None 
+    removed=[item for item in oldrxn if item not in rxn] 
+    affected={item for item in rxn if fingerprints[1][item]!=oldfingerprints[1].get(item) or 
+              any([state in changeditm for side in get_states(rxn[item]) for state in side])} 
+      
+    # Intermediates: new rows keep the pressure, concentration and equation set by process_intermediates. 
+    for item in changeditm : 
+        for key in ['pressure','concentration','diff'] : 
+            if key in olditm[item] : 
+                itm[item][key]=olditm[item][key] 
+        olditm[item]=itm[item] 
+    itm=olditm 
+    sub={item:rxn[item] for item in affected} 
+    elecpot=get_elecpot(conf) 
+    if conf.has_section('Electrochemistry') : 
+        get_nelect_for_rxn(conf,itm,sub) 
+    if elecpot !=0 : 
+        adjust_energy_with_potential(conf,{item:itm[item] for item in changeditm},elecpot) 
+        adjust_energy_with_potential(conf,sub,elecpot) 
+      
+    # Process the affected reactions alone, on a copy of the equations that is discarded. 
+    submodel=compile_model(conf,itm,sub) 
+    if any(['lateral' in m or 'vibkey' in m or 'program' in m for m in [oldmodel,submodel]]) : 
+        return None # Lateral interactions and vibrations are compiled for the whole network. 
+    process_rxn(conf,{item:dict(record) for item,record in itm.items()},sub,{},submodel) 
+     
+    # Merge the arrays of the reactions: kept rows from the old model, the others from the new one. 
+    oldindex={item:j for j,item in enumerate(oldmodel['rxn'])} 
+    subindex={item:j for j,item in enumerate(submodel['rxn'])} 
+    model=submodel 
+    model['rxn']=sorted(rxn) 
+    rows=np.array([subindex[item]+len(oldmodel['rxn']) if item in affected else oldindex[item] 
+                   for item in model['rxn']],dtype=int) 
+    # States of both as w slots per side, the widest of the two. 
+    w=max(oldmodel['state'].shape[1],submodel['state'].shape[1])//2 
+    for m in [oldmodel,submodel] : 
+        for key,fill in [('state',-1),('damped',False)] : 
+            pad=np.full((m[key].shape[0],w-m[key].shape[1]//2),fill,dtype=m[key].dtype) 
+            half=m[key].shape[1]//2 
+            m[key]=np.hstack((m[key][:,:half],pad,m[key][:,half:],pad)) 
+    for key in ['state','damped','GTS','dGd','aGd','aGi','neTS','ned','nei','gasd','gasi','mwd','mwi'] : 
+        model[key]=np.concatenate([oldmodel[key],submodel[key]])[rows] 
+    rxn={item:(sub[item] if item in affected else oldrxn[item]) for item in model['rxn']} 
+    ltp['rxn']=['sr'+item for item in model['rxn']] 
+     
+    # Rebuild the differential equations touched by affected and removed reactions, as process_rxn. 
+    touched=set(oldmodel['state'][[oldindex[item] for item in removed+sorted(affected) 
+                                   if item in oldindex]].ravel()) 
+    touched|=set(model['state'][[j for j,item in enumerate(model['rxn']) if item in affected]].ravel()) 
+    for i in sorted(touched&set(model['dyn'])) : 
+        item=model['itm'][i] 
+        itm[item]['diff']="eqd"+item+":=diff(c"+item+"(t),t)="+"".join(diff_terms(model,i)) 
+    return itm,rxn,ltp,model,sbalance,sodesolv,initialc,rhsparse 
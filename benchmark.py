@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+"""Benchmark of the generation of the Maple input and of the in-process solvers.
+
+Runs every stage of amk.py on the test-* cases, or on synthetic networks, and records
+the wall time (best of several runs) and the peak memory (tracemalloc) of each stage.
+Results are appended as JSON lines to benchmark.jsonl, one line per case and stage,
+and summarized as a table.
+
+Usage:
+    python benchmark.py                          # Every test-* case with itm.csv, rxn.csv, parameters.txt.
+    python benchmark.py test-12-aqu-reactants/01 --native
+    python benchmark.py --synthetic 10 100 1000 10000 --gas 0.1 --aqu 0.1 --stiffness 8
+    python benchmark.py --lateral --native       # Stiff lateral interactions near full coverage.
+Cases are run on a temporary copy of their inputs, without the sections that do not
+change the work of the stages (Cache, Checkpoint, Log, Sweep, RateControl).
+"""
+
+# Load libraries
+import amklib
+import numpy as np
+import os, sys, io, glob, json, time, shutil, tempfile, argparse, contextlib, tracemalloc
+
+skippedsections=['Cache','Checkpoint','Log','Sweep','RateControl'] # Not benchmarked.
+
+def synthetic_network(directory,nitm,nrxn,gas=0.1,aqu=0.1,stiffness=6.0,T=373.0,seed=0) :
+    """Writes itm.csv, rxn.csv, and parameters.txt of a random, connected network.
+    Each gas or aqueous species adsorbs on a free site (i000000, the site-balance species)
+    into its own surface species; the remaining reactions, isomerizations, dissociations
+    and associations, conserve the number of sites. Energies are thermodynamically
+    consistent: the transition state lies above both sides.
+
+    Args:
+        directory: Where the files are written, created if needed.
+        nitm: Number of intermediates, besides the free site.
+        nrxn: Number of reactions, at least one per intermediate (but one).
+        gas, aqu: Fractions of gas and aqueous species (the rest are adsorbed).
+        stiffness: Decades spanned by the rate constants at T.
+        T: Temperature in K.
+        seed: Seed of the random generator.
+    """
+    rng=np.random.default_rng(seed)
+    ngas=int(round(gas*nitm))
+    naqu=int(round(aqu*nitm))
+    ncat=nitm-ngas-naqu
+    if ncat<max(1,ngas+naqu) or nrxn<ngas+naqu+ncat-1 :
+        print("Cannot build a network of",nitm,"intermediates and",nrxn,"reactions with",
+              ngas,"gas and",naqu,"aqueous species:\n each gas/aqu species needs a surface species, "
+              "and each surface species a reaction.")
+        exit()
+
+    # Intermediates: label with the carbon number as first digit, as in the test cases.
+    sbs='i000000'
+    cat=['i'+str(k%10)+'{:05d}'.format(k+1) for k in range(ncat)]
+    fluid=(['g'+str(k%10)+'{:05d}'.format(k+1) for k in range(ngas)]+
+           ['q'+str(k%10)+'{:05d}'.format(ngas+k+1) for k in range(naqu)])
+    phase=dict([(sbs,'cat')]+[(item,'cat') for item in cat]+
+               [(item,'gas') for item in fluid[:ngas]]+[(item,'aqu') for item in fluid[ngas:]])
+    G=dict(zip(cat+fluid,rng.normal(0.0,0.3,ncat+ngas+naqu)))
+    G[sbs]=0.0
+
+    # Reactions as (is1, is2, fs1, fs2): adsorptions, a spanning tree of the surface species,
+    # and random steps among them.
+    steps=[(item,sbs,cat[k],'None') for k,item in enumerate(fluid)]
+    for k in range(1,ncat) :
+        steps.append((cat[rng.integers(k)],'None',cat[k],'None'))
+    while len(steps)<nrxn :
+        a,b,c=rng.choice(ncat,3,replace=ncat<3)
+        kind=rng.integers(3)
+        if   kind==0 :
+            steps.append((cat[a],'None',cat[b],'None'))
+        elif kind==1 :
+            steps.append((cat[a],sbs,cat[b],cat[c]))
+        else :
+            steps.append((cat[a],cat[b],cat[c],sbs))
+
+    # Activation energies spread over "stiffness" decades of rate constants.
+    kT=float(amklib.kbev)*T
+    barrier=0.2+rng.uniform(0.0,stiffness*np.log(10)*kT,len(steps))
+
+    os.makedirs(directory,exist_ok=True)
+    with open(os.path.join(directory,'itm.csv'),'w') as f :
+        f.write("label      phase   formula   G                 mw     ne  frq\n")
+        for item in [sbs]+cat+fluid :
+            f.write("{:10s} {:7s} {:9s} {: .12f} {:6.1f} {:3d} []\n".format(
+                    item,phase[item],'X'+item[1:],G[item],28.0,0))
+    with open(os.path.join(directory,'rxn.csv'),'w') as f :
+        f.write("label      is1      is2      fs1      fs2      G                 ne  frq\n")
+        for j,state in enumerate(steps) :
+            GTS=max(sum(G.get(item,0.0) for item in state[:2]),
+                    sum(G.get(item,0.0) for item in state[2:]))+barrier[j]
+            f.write("{:10s} {:8s} {:8s} {:8s} {:8s} {: .12f} {:3d} []\n".format(
+                    'r{:06d}'.format(j+1),*state,GTS,0))
+    with open(os.path.join(directory,'parameters.txt'),'w') as f :
+        f.write("[General]\n  mapleoutput=synthetic.xls\n\n")
+        f.write("[Reactor]\n  reactortemp="+str(T)+"\n  time1=[ 1E-6, 1E-3, 1E0, 1E3 ]\n"
+                "  damptime=1\n\n")
+        f.write("[Catalyst]\n  name=\"Synthetic\"\n  sitebalancespecies="+sbs+
+                "\n  areaactivesite=6.60125\n  secondlayerthickness=4.5\n\n")
+        f.write("[Pressures]\n"+"".join("  "+item+"=1\n" for item in fluid[:ngas:2])+"\n")
+        f.write("[Concentrations]\n"+"".join("  "+item+"=1\n" for item in fluid[ngas::2])+"\n")
+
+
+def lateral_network(directory) :
+    """Writes itm.csv, rxn.csv, and parameters.txt of a small network with lateral interactions
+    that drive the surface close to full coverage by iU (csbs about 1E-11), where BDF stalls on
+    tiny steps in the last time and integrate_sode has to fall back to Radau.
+    """
+    os.makedirs(directory,exist_ok=True)
+    with open(os.path.join(directory,'itm.csv'),'w') as f :
+        f.write("label  phase  formula  G       ne  mw    frq  lateral\n"
+                " gR     gas    R         0.000  0  52.0  []   []\n"
+                " gP     gas    P         0.100  0  52.0  []   []\n"
+                " gU     gas    U         0.100  0  52.0  []   []\n"
+                " iO     cat    Site      0.000  0   0.0  []   []\n"
+                " iR     cat    R        -1.000  0  52.0  []   [iR:0.10,iU:0.05]\n"
+                " iI1    cat    I1       -1.050  0  52.0  []   []\n"
+                " iI2    cat    I2       -0.950  0  52.0  []   []\n"
+                " iP     cat    P        -1.000  0  52.0  []   []\n"
+                " iU     cat    U        -2.000  0  52.0  []   [iU:0.2]\n")
+    with open(os.path.join(directory,'rxn.csv'),'w') as f :
+        f.write("label  is1  is2   fs1  fs2   G      ne  frq  lateral\n"
+                " aR     gR   iO    iR   None   0.00  0  []   []\n"
+                " aP     gP   iO    iP   None   0.10  0  []   []\n"
+                " aU     gU   iO    iU   None   0.10  0  []   []\n"
+                " r1     iR   None  iI1  None  -0.02  0  []   [iR:0.05]\n"
+                " r2     iR   None  iI2  None   0.02  0  []   []\n"
+                " r3     iI1  None  iP   None   0.03  0  []   []\n"
+                " r4     iI2  None  iP   None  -0.03  0  []   []\n"
+                " r5     iI2  None  iU   None   0.40  0  []   []\n")
+    with open(os.path.join(directory,'parameters.txt'),'w') as f :
+        f.write("[General]\n  mapleoutput=lateral.xls\n\n")
+        f.write("[Reactor]\n  reactortemp=373\n  time1=[ 1E-6, 1E-3, 1E0, 1E3, 1E6, 1E9, 1E12 ]\n"
+                "  damptime=1\n\n")
+        f.write("[Catalyst]\n  name=\"Lateral\"\n  sitebalancespecies=iO"
+                "\n  areaactivesite=6.60125\n  secondlayerthickness=4.5\n\n")
+        f.write("[Pressures]\n  gR=1\n\n")
+        f.write("[Solver]\n  backend=Python\n")
+
+
+def stages(conf,native) :
+    """Stages of amk.py, as a list of (name, function of the dict of results so far),
+    without the cache. The steady state or the time course is solved in-process if native.
+    """
+    def read(s) :
+        s['itm']=amklib.read('./itm.csv')
+        s['rxn']=amklib.read('./rxn.csv')
+    def reduce_network(s) :
+        s['itm'],s['rxn']=amklib.reduce_network(conf,s['itm'],s['rxn'])
+    def adjust_energy(s) :
+        elecpot=amklib.get_elecpot(conf)
+        if elecpot!=0 :
+            amklib.get_nelect_for_rxn(conf,s['itm'],s['rxn'])
+            amklib.adjust_energy_with_potential(conf,s['itm'],elecpot)
+            amklib.adjust_energy_with_potential(conf,s['rxn'],elecpot)
+    def process_intermediates(s) :
+        s['ltp']={}
+        (s['itm'],s['sbalance'],s['sodesolv'],s['initialc'],
+         s['rhsparse'])=amklib.process_intermediates(conf,s['itm'],s['ltp'])
+    def compile_model(s) :
+        s['model']=amklib.compile_model(conf,s['itm'],s['rxn'])
+    def process_rxn(s) :
+        s['itm'],s['rxn']=amklib.process_rxn(conf,s['itm'],s['rxn'],s['ltp'],s['model'])
+    def quasi_equilibrium_maple(s) :
+        s['itm'],s['initialc'],s['sodesolv']=amklib.quasi_equilibrium_maple(
+            conf,amklib.compile_network(conf,s['model']),s['itm'],s['initialc'],s['sodesolv'])
+    def printtxt(s) :
+        amklib.printtxt(conf,s['itm'],s['rxn'],s['sbalance'],s['initialc'],s['sodesolv'],
+                        s['rhsparse'],s['ltp'],out=io.StringIO())
+    def compile_network(s) :
+        s['network']=amklib.compile_network(conf,s['model'])
+    def solve(s) :
+        if amklib.get_reactortype(conf)=='SteadyState' :
+            amklib.solve_steady(conf,s['network'],s['ltp'])
+        else :
+            amklib.solve_sode(conf,s['network'],s['ltp'])
+
+    stage=[read]
+    if conf.has_section('Reduction') :
+        stage.append(reduce_network)
+    stage+=[adjust_energy,process_intermediates,compile_model,process_rxn]
+    if amklib.get_quasiequilibrium(conf)>0 :
+        stage.append(quasi_equilibrium_maple)
+    stage.append(printtxt)
+    if native :
+        stage+=[compile_network,solve]
+    return [(function.__name__,function) for function in stage]
+
+
+def run_case(directory,native=False,repeat=3) :
+    """Runs the stages (see stages) on a temporary copy of the inputs of a case.
+
+    Returns:
+        results: List of dicts with the stage, best wall time in s, peak memory in bytes
+            (from a last run traced by tracemalloc), and the size of the network; or a single
+            dict with the error if the case stops.
+    """
+    directory=os.path.abspath(directory)
+    cwd=os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp :
+        for filename in ['itm.csv','rxn.csv','parameters.txt'] :
+            shutil.copy(os.path.join(directory,filename),tmp)
+        os.chdir(tmp)
+        try :
+            conf=amklib.readconf('./parameters.txt')
+            for section in skippedsections :
+                conf.remove_section(section)
+            if conf.has_option('General','mapleinput') :
+                conf.remove_option('General','mapleinput')
+            wall={}
+            peak={}
+            output=io.StringIO()
+            for run in range(repeat+1) :
+                traced=run==repeat
+                s={}
+                for name,function in stages(conf,native) :
+                    if traced :
+                        tracemalloc.start()
+                    start=time.perf_counter()
+                    with contextlib.redirect_stdout(output) :
+                        function(s)
+                    elapsed=time.perf_counter()-start
+                    if traced :
+                        peak[name]=tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                    else :
+                        wall[name]=min(wall.get(name,np.inf),elapsed)
+            size=amklib.network_size(s['model'])
+            return [dict(stage=name,wall=wall[name],peak=peak[name],**size) for name in wall]
+        except (SystemExit,Exception) as error :
+            if tracemalloc.is_tracing() :
+                tracemalloc.stop()
+            message=(output.getvalue().strip().splitlines() or [repr(error)])[-1] if 'output' in locals() else repr(error)
+            return [dict(stage='error',error=message.strip())]
+        finally :
+            os.chdir(cwd)
+
+
+def test_cases(root='.') :
+    """Directories of the test-* cases with itm.csv, rxn.csv, and parameters.txt.
+    """
+    cases=[]
+    for filename in sorted(glob.glob(os.path.join(root,'test-*','**','parameters.txt'),recursive=True)) :
+        directory=os.path.dirname(filename)
+        if os.path.isfile(os.path.join(directory,'itm.csv')) and os.path.isfile(os.path.join(directory,'rxn.csv')) :
+            cases.append(directory)
+    return cases
+
+
+if __name__=='__main__' :
+    parser=argparse.ArgumentParser(description="Benchmark of the stages of amk.py.")
+    parser.add_argument('cases',nargs='*',help="Case directories. Every test-* case by default.")
+    parser.add_argument('--native',action='store_true',help="Also solve in-process.")
+    parser.add_argument('--repeat',type=int,default=3,help="Timed runs per case; the best is kept.")
+    parser.add_argument('--synthetic',type=int,nargs='+',default=[],metavar='NRXN',
+                        help="Synthetic networks with these numbers of reactions instead.")
+    parser.add_argument('--species',type=float,default=0.5,help="Intermediates per reaction.")
+    parser.add_argument('--gas',type=float,default=0.1,help="Fraction of gas species.")
+    parser.add_argument('--aqu',type=float,default=0.1,help="Fraction of aqueous species.")
+    parser.add_argument('--stiffness',type=float,default=6.0,help="Decades of rate constants.")
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--lateral',action='store_true',
+                        help="Also the network with lateral interactions of lateral_network.")
+    parser.add_argument('--output',default='benchmark.jsonl',help="JSON-lines file, appended.")
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as synthetic :
+        cases=args.cases
+        if args.synthetic :
+            cases=[]
+            for nrxn in args.synthetic :
+                directory=os.path.join(synthetic,'synthetic-'+str(nrxn))
+                synthetic_network(directory,max(3,int(args.species*nrxn)),nrxn,args.gas,args.aqu,
+                                  args.stiffness,seed=args.seed)
+                cases.append(directory)
+        elif not cases and not args.lateral :
+            cases=test_cases()
+        if args.lateral :
+            directory=os.path.join(synthetic,'lateral')
+            lateral_network(directory)
+            cases=cases+[directory]
+
+        names=[]
+        table={}
+        with open(args.output,'a') as out :
+            for case in cases :
+                label=os.path.basename(case) if args.synthetic or case.startswith(synthetic) else os.path.normpath(case)
+                results=run_case(case,args.native,args.repeat)
+                for result in results :
+                    out.write(json.dumps(dict(time=time.time(),case=label,**result))+"\n")
+                    if result['stage'] not in names :
+                        names.append(result['stage'])
+                table[label]={result['stage']:result for result in results}
+                out.flush()
+
+    # Summary: wall time in ms and peak memory in MB of each stage, errors last.
+    names.sort(key=lambda name : name=='error')
+    print("{:50s} {:>6s} {:>6s}".format('case','itm','rxn')+
+          "".join(" {:>22s}".format(name[:22]) for name in names))
+    for label,results in table.items() :
+        first=next(iter(results.values()))
+        line="{:50s} {:>6} {:>6}".format(label[-50:],first.get('intermediates',''),first.get('reactions',''))
+        for name in names :
+            if name not in results :
+                line+=" {:>22s}".format('')
+            elif name=='error' :
+                line+=" {:>22s}".format(results[name]['error'][:22])
+            else :
+                line+=" {:>12.2f}ms {:>5.1f}MB".format(1E3*results[name]['wall'],results[name]['peak']/2**20)
+        print(line)
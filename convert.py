@@ -0,0 +1,20 @@
+#!/usr/bin/python3 
+# -*- coding: utf-8 -*-
+# 
+"""Converts text outputs of Maple (mapleoutput) into the columnar binary format of 
+amklib.write_columns, one .npz next to each file. 
+
+Usage: 
+    python convert.py Cu111HE1402.xls [more outputs] 
+Read them back, memory-mapped, with amklib.read_columns('Cu111HE1402.npz',['timei','i1*']). 
+"""
+
+# Load libraries 
+import amklib 
+import sys 
+
+if len(sys.argv)<2 : 
+    print(__doc__) 
+    exit() 
+for filename in sys.argv[1:] : 
+    print(filename,"->",amklib.convert_results(filename)) 